@@ -1,59 +1,57 @@
-import csv
-from datetime import datetime
 from django.contrib import admin
-from django.http import HttpResponse
-from hunger.models import InvitationCode, Invitation
-from hunger.utils import now
+try:
+    from django.http import StreamingHttpResponse
+except ImportError:
+    # Django < 1.5 iterates over the content of a plain HttpResponse.
+    from django.http import HttpResponse as StreamingHttpResponse
+from hunger.email import send_invites
+from hunger.export import iter_csv, iter_gzip
+from hunger.models import InvitationCode, Invitation, InvitationEmail
 
 
 def export_email(modeladmin, request, queryset):
-    response = HttpResponse(mimetype='text/csv')
+    response = StreamingHttpResponse(iter_csv(queryset),
+                                     content_type='text/csv')
     response['Content-Disposition'] = 'attachment; filename=email.csv'
-    writer = csv.writer(response)
-
-    writer.writerow(['email', 'created', 'invited', 'used'])
-
-    for obj in queryset:
-        code = obj.code
-        email = obj.user.email
-        used = obj.used
-        invited = obj.invited
-        created = datetime.strftime(code.created, "%Y-%m-%d %H:%M:%S")
-        try:
-            invited = datetime.strftime(obj.invited, "%Y-%m-%d %H:%M:%S")
-        except TypeError:
-            invited = ''
-        try:
-            used = datetime.strftime(obj.used, "%Y-%m-%d %H:%M:%S")
-        except TypeError:
-            used = ''
-
-        if email:
-            row = [email, created, invited, used]
-            writer.writerow(row)
-    # Return CSV file to browser as download
+    # Stream CSV file to browser as download
+    return response
+
+
+def export_email_gzip(modeladmin, request, queryset):
+    response = StreamingHttpResponse(iter_gzip(iter_csv(queryset)),
+                                     content_type='application/gzip')
+    response['Content-Disposition'] = 'attachment; filename=email.csv.gz'
     return response
 
 
 def send_invite(modeladmin, request, queryset):
-    for obj in queryset:
-        obj.invited = now()
-        obj.save(send_email=True, request=request)
+    sent, seconds = send_invites(queryset, request=request)
+    modeladmin.message_user(request, 'Sent %d invitations in %.2fs.' % (
+        sent, seconds))
 
 
 class InvitationAdmin(admin.ModelAdmin):
     list_display = ('user', 'email', 'code', 'used', 'invited')
     list_filter = ('code',)
     search_fields = ['user__username', 'user__email']
-    actions = [send_invite, export_email]
+    actions = [send_invite, export_email, export_email_gzip]
 
 
 class InvitationCodeAdmin(admin.ModelAdmin):
     """Admin for invitation code"""
-    list_display = ('code', 'num_invites', 'owner', )
+    list_display = ('code', 'num_invites', 'num_invited',
+                    'remaining_invites', 'owner', )
     filter_horizontal = ('invited_users', )
     search_fields = ['created_by__email', 'owner__username']
 
 
+class InvitationEmailAdmin(admin.ModelAdmin):
+    """Admin for the invitation email outbox"""
+    list_display = ('email', 'status', 'attempts', 'next_attempt', 'sent')
+    list_filter = ('status',)
+    search_fields = ['email']
+
+
 admin.site.register(Invitation, InvitationAdmin)
 admin.site.register(InvitationCode, InvitationCodeAdmin)
+admin.site.register(InvitationEmail, InvitationEmailAdmin)
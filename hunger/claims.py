@@ -0,0 +1,120 @@
+"""
+Claiming email invitations for new and returning users.
+
+Invitations sent to an email address have no user until somebody
+follows the link, gets the ``hunger_code`` cookie and logs in with the
+same address. With ``HUNGER_CLAIM_INVITATIONS`` enabled, the
+invitations waiting for a user's email are linked to the user as soon
+as the user is created or logs in, cookie or not:
+
+* an invitation carrying a code that was sent is redeemed like
+  :meth:`Invitation.accept_invite <hunger.models.Invitation.accept_invite>`
+  does, taking one of the code's remaining invites, so the user is in
+  beta right away; one that was never sent is left alone;
+* an invitation sent without a code is accepted on the next request,
+  as before;
+* a waitlist entry keeps its position.
+
+Owning the address stands in for following the emailed link, so this
+is only safe when user emails are verified before the account is
+active or can log in. Emails are matched as typed by the user and
+normalized (see
+:func:`hunger.utils.normalize_email`), so invitations stored with other
+capitalization are left to the cookie.
+"""
+from itertools import groupby
+
+from django.db.models import F
+
+from hunger import status
+from hunger.snapshot import get_snapshot
+from hunger.utils import setting, get_user_model, normalize_email, now
+
+
+def claim_invitations(user, request=None):
+    """
+    Link the invitations waiting for ``user.email`` to ``user``.
+
+    Invitations are found with one query. Those without a code are
+    claimed with one conditional UPDATE; each one with a code is
+    claimed with its own, and only then takes one of the code's
+    invites, or is given back when the code has run out. Codes the
+    user already holds are skipped, as are further invitations with
+    the same code, since a user holds every code once. Returns the
+    number of invitations claimed.
+    """
+    from hunger.models import Invitation, InvitationCode, atomic
+
+    if user.pk is None or not user.email:
+        return 0
+    emails = set([user.email, normalize_email(user.email)])
+    held = Invitation.objects.filter(
+        user=user, code__isnull=False).values('code')
+    pending = list(Invitation.objects.filter(
+        user=None, email__in=emails).exclude(code__in=held).order_by(
+        'code', 'pk').values_list('pk', 'code', 'used', 'invited',
+                                  'position'))
+    if not pending:
+        return 0
+
+    linked, redeemed = [], []
+    for code_id, rows in groupby(pending, lambda row: row[1]):
+        rows = list(rows)
+        if code_id is None:
+            linked.extend(row[0] for row in rows)
+            continue
+        # Only invitations that were sent: the code is what the email
+        # carried, an unsent one was never offered to this address.
+        sent = [row for row in rows if row[3] is not None]
+        if sent:
+            redeemed.append(sent[0])
+
+    admitted = 0
+    with atomic():
+        for pk, code_id, used, invited, position in redeemed:
+            timestamp = now()
+            if not Invitation.objects.filter(pk=pk, user=None).update(
+                    user=user, used=timestamp, invited=timestamp,
+                    position=None):
+                # Somebody else claimed it meanwhile.
+                continue
+            if InvitationCode.objects.filter(
+                pk=code_id, num_invites__gt=0,
+            ).update(num_invites=F('num_invites') - 1,
+                     num_invited=F('num_invited') + 1):
+                admitted += 1
+            else:
+                # The code has run out, give the invitation back.
+                Invitation.objects.filter(pk=pk).update(
+                    user=None, used=used, invited=invited,
+                    position=position)
+        claimed = admitted
+        if linked:
+            claimed += Invitation.objects.filter(
+                pk__in=linked, user=None).update(user=user)
+
+    # The UPDATEs send no post_save, prime the status ourselves.
+    if admitted:
+        status.set_status(user.pk)
+        snapshot = get_snapshot()
+        if snapshot is not None:
+            snapshot.add(user.pk)
+        if request is not None:
+            request.session['hunger_in_beta'] = True
+    else:
+        status.invalidate(user.pk)
+    return claimed
+
+
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    """Claim the invitations of a newly created, active user."""
+    if (not created or raw or not setting('HUNGER_CLAIM_INVITATIONS') or
+            sender is not get_user_model() or not instance.is_active):
+        return
+    claim_invitations(instance)
+
+
+def user_logged_in(sender, request, user, **kwargs):
+    """Claim the invitations waiting for a user logging in."""
+    if setting('HUNGER_CLAIM_INVITATIONS'):
+        claim_invitations(user, request)
@@ -0,0 +1,77 @@
+"""
+Cache of invitation code lookups.
+
+When ``HUNGER_CODE_CACHE`` names a cache, the lookup of the code in a
+``hunger_code`` cookie is remembered for ``HUNGER_CODE_CACHE_TIMEOUT``
+seconds, whether the code turned out usable or not, so that neither
+repeated nor bogus codes cost a query each. Entries are dropped when an
+InvitationCode is saved; redemption re-checks ``num_invites`` in its
+conditional UPDATE, so a stale entry never lets anybody in.
+"""
+import hashlib
+
+from django.core.cache import get_cache
+from django.test.signals import setting_changed
+
+from hunger.utils import setting
+
+# Cached for codes that do not exist or have no invites left.
+INVALID = 0
+
+_backend = {}
+
+
+def get_backend():
+    """Return the configured cache backend, or None when disabled."""
+    name = setting('HUNGER_CODE_CACHE')
+    if not name:
+        return None
+    try:
+        return _backend[name]
+    except KeyError:
+        _backend.clear()
+        backend = _backend[name] = get_cache(name)
+        return backend
+
+
+def cache_key(code):
+    # Codes come from cookies, so hash them into a safe key.
+    return 'hunger:code:%s' % hashlib.md5(code.encode('utf-8')).hexdigest()
+
+
+def lookup(code):
+    """Return the pk of the InvitationCode ``code`` if it has invites
+    left, or None."""
+    from hunger.models import InvitationCode
+
+    backend = get_backend()
+    if backend is not None:
+        pk = backend.get(cache_key(code))
+        if pk is not None:
+            return pk or None
+    pks = InvitationCode.objects.filter(
+        code=code, num_invites__gt=0).values_list('pk', flat=True)[:1]
+    pk = pks[0] if pks else None
+    if backend is not None:
+        backend.set(cache_key(code), pk or INVALID,
+                    setting('HUNGER_CODE_CACHE_TIMEOUT'))
+    return pk
+
+
+def forget(*codes):
+    backend = get_backend()
+    if backend is None:
+        return
+    backend.delete_many([cache_key(code) for code in codes if code])
+
+
+def code_changed(sender, instance, **kwargs):
+    """Drop the cached lookup when an invitation code is saved."""
+    forget(instance.code)
+
+
+def reset_backend(sender, **kwargs):
+    if kwargs['setting'] == 'HUNGER_CODE_CACHE':
+        _backend.clear()
+
+setting_changed.connect(reset_backend)
@@ -0,0 +1,125 @@
+"""
+Invitation code generation and checking.
+
+Codes are drawn from ``os.urandom``: a whole batch of random bytes is
+mapped onto the alphabet with a single ``translate`` call, dropping the
+bytes that would bias the result, then cut into codes.
+
+By default codes are ``HUNGER_CODE_LENGTH`` random letters and any code
+is worth a lookup. With ``HUNGER_CODE_TAG_LENGTH`` set, every code ends
+in that many characters of an HMAC of the rest, keyed on
+``SECRET_KEY``, so :func:`check_code` turns away malformed and forged
+codes without a query. With the :data:`CROCKFORD` alphabet, codes are
+read the Crockford way: case-insensitive, hyphens ignored, ``O`` as
+``0`` and ``I``/``L`` as ``1``.
+"""
+import os
+import string
+
+from django.utils.crypto import constant_time_compare, salted_hmac
+
+from hunger import codecache
+from hunger.utils import setting
+
+ALPHABET = string.ascii_letters
+LENGTH = 16
+CROCKFORD = '0123456789ABCDEFGHJKMNPQRSTVWXYZ'
+
+TAG_SALT = 'hunger.codes'
+
+
+def _translation(alphabet):
+    size = len(alphabet)
+    limit = 256 - 256 % size
+    table = bytes(bytearray(ord(alphabet[i % size]) for i in range(256)))
+    delete = bytes(bytearray(range(limit, 256)))
+    return table, delete, limit
+
+
+def random_codes(count, alphabet=None, length=None):
+    """Return ``count`` random codes (duplicates are possible).
+
+    The alphabet and length default to ``HUNGER_CODE_ALPHABET`` and
+    ``HUNGER_CODE_LENGTH``.
+    """
+    alphabet = alphabet or setting('HUNGER_CODE_ALPHABET')
+    length = length or setting('HUNGER_CODE_LENGTH')
+    table, delete, limit = _translation(alphabet)
+    needed = count * length
+    chars = b''
+    while len(chars) < needed:
+        missing = needed - len(chars)
+        data = os.urandom(missing * 256 // limit + 16)
+        chars += data.translate(table, delete)
+    chars = chars[:needed].decode('ascii')
+    return [chars[i:i + length] for i in range(0, needed, length)]
+
+
+def tag(body):
+    """The ``HUNGER_CODE_TAG_LENGTH`` characters authenticating ``body``."""
+    alphabet = setting('HUNGER_CODE_ALPHABET')
+    digest = bytearray(salted_hmac(TAG_SALT, body).digest())
+    return ''.join(alphabet[b % len(alphabet)]
+                   for b in digest[:setting('HUNGER_CODE_TAG_LENGTH')])
+
+
+def new_codes(count):
+    """Return ``count`` random codes in the configured scheme."""
+    bodies = random_codes(count)
+    if not setting('HUNGER_CODE_TAG_LENGTH'):
+        return bodies
+    return [body + tag(body) for body in bodies]
+
+
+def check_code(code):
+    """
+    Return ``code`` normalized, or None when it cannot be a valid code.
+
+    Without tags every code passes; with them, only codes of the right
+    length and alphabet whose tag matches do.
+    """
+    if not code:
+        return None
+    alphabet = setting('HUNGER_CODE_ALPHABET')
+    if alphabet == CROCKFORD:
+        code = code.replace('-', '').upper()
+        code = code.replace('O', '0').replace('I', '1').replace('L', '1')
+    tag_length = setting('HUNGER_CODE_TAG_LENGTH')
+    if not tag_length:
+        return code
+    if len(code) != setting('HUNGER_CODE_LENGTH') + tag_length:
+        return None
+    if code.strip(alphabet):
+        # Some character is outside the alphabet.
+        return None
+    body = code[:-tag_length]
+    if not constant_time_compare(code[-tag_length:], tag(body)):
+        return None
+    return code
+
+
+def generate_codes(count, max_invites=1, batch_size=500, **kwargs):
+    """
+    Create ``count`` new InvitationCodes, ``batch_size`` at a time.
+
+    Each batch is de-duplicated in memory and against the database with
+    one ``code__in`` query, then inserted with ``bulk_create``. Yields
+    the list of codes created by each batch. Extra keyword arguments are
+    passed on to the InvitationCode constructor.
+    """
+    from hunger.models import InvitationCode
+
+    created = 0
+    while created < count:
+        codes = set(new_codes(min(batch_size, count - created)))
+        codes.difference_update(InvitationCode.objects.filter(
+            code__in=codes).values_list('code', flat=True))
+        codes = sorted(codes)
+        InvitationCode.objects.bulk_create([
+            InvitationCode(code=code, max_invites=max_invites,
+                           num_invites=max_invites, **kwargs)
+            for code in codes])
+        # bulk_create sends no post_save, forget lookups of the codes.
+        codecache.forget(*codes)
+        created += len(codes)
+        yield codes
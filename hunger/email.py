@@ -1,13 +1,17 @@
 import os.path
+import time
 import logging
 
 from django.conf import settings
-from django.core.mail import EmailMultiAlternatives
+from django.core.mail import EmailMultiAlternatives, get_connection
 from django.core.urlresolvers import reverse
 from django.template.loader import get_template
 from django.template import Context
+from django.test.signals import setting_changed
 
-from hunger.utils import setting
+from hunger import status
+from hunger.metrics import get_metrics, timer
+from hunger.utils import setting, now, absolute_uri
 
 try:
     from templated_email import send_templated_mail
@@ -18,6 +22,93 @@ except ImportError:
 logger = logging.getLogger(__name__)
 
 
+def get_invite_url(code, request=None):
+    if code:
+        return absolute_uri(reverse("hunger-verify", args=[code]), request)
+    # in invitation_code_sent,
+    # if the invitation has a user, we do not need a code.
+    return absolute_uri('/', request)
+
+
+def get_templates_folder():
+    return os.path.join(setting('HUNGER_EMAIL_TEMPLATES_DIR'), '')
+
+
+_template_bundles = {}
+
+
+def get_invite_templates(templates_folder):
+    """
+    Return the compiled (subject, plaintext, html) invite templates.
+
+    Each templates folder is loaded and compiled once; the bundles are
+    dropped when template settings change, and not kept at all with
+    ``DEBUG`` on so that template edits show up right away.
+    """
+    try:
+        return _template_bundles[templates_folder]
+    except KeyError:
+        pass
+    templates = (
+        get_template(os.path.join(templates_folder,
+                                  'invite_email_subject.txt')),
+        get_template(os.path.join(templates_folder, 'invite_email.txt')),
+        get_template(os.path.join(templates_folder, 'invite_email.html')),
+    )
+    if not settings.DEBUG:
+        _template_bundles[templates_folder] = templates
+    return templates
+
+
+def clear_template_bundles(sender, **kwargs):
+    if kwargs['setting'] in ('TEMPLATE_DIRS', 'TEMPLATE_LOADERS',
+                             'HUNGER_EMAIL_TEMPLATES_DIR', 'DEBUG'):
+        _template_bundles.clear()
+
+setting_changed.connect(clear_template_bundles)
+
+
+def render_invite(templates, email, context, from_email):
+    """Render loaded invite templates into an unsent email message.
+
+    ``context`` is a dict or a template Context.
+    """
+    subject, plaintext, html = templates
+    if not isinstance(context, Context):
+        context = Context(context)
+    msg = EmailMultiAlternatives(subject.render(context),
+                                 plaintext.render(context), from_email,
+                                 [email], headers={'From': '%s' % from_email})
+    msg.attach_alternative(html.render(context), "text/html")
+    return msg
+
+
+def render_invites(invitations, request=None, from_email=None):
+    """
+    Yield an unsent invite email for each sendable Invitation.
+
+    The templates come from the bundle cache and a single template
+    Context is reused, with each invitation's values pushed on top of
+    it and popped after rendering.
+    """
+    from hunger.signals import invitation_recipient
+
+    templates = get_invite_templates(get_templates_folder())
+    from_email = from_email or getattr(settings, 'DEFAULT_FROM_EMAIL')
+    context = Context()
+    for invitation in invitations:
+        email, code = invitation_recipient(invitation)
+        if email is None:
+            continue
+        context.update({'invite_url': get_invite_url(code, request),
+                        'user': invitation.user})
+        try:
+            msg = render_invite(templates, email, context, from_email)
+        finally:
+            context.pop()
+        yield msg
+
+
 def beta_invite(email, code, request, **kwargs):
     """
     Email for sending out the invitation code to the user.
@@ -25,23 +116,12 @@ def beta_invite(email, code, request, **kwargs):
     django template engine.
     """
     context_dict = kwargs.copy()
-    if code:
-        invite_url = request.build_absolute_uri(
-            reverse("hunger-verify", args=[code])
-        )
-    else:
-        # in invitation_code_sent,
-        # if the invitation has a user, we do not need a code.
-        invite_url = request.build_absolute_uri('/')
-
-    logger.debug("%s %s" % (code, invite_url))
-
-    context_dict.setdefault("invite_url", invite_url)
+    if 'invite_url' not in context_dict:
+        context_dict['invite_url'] = get_invite_url(code, request)
 
-    context = Context(context_dict)
+    logger.debug("%s %s" % (code, context_dict['invite_url']))
 
-    templates_folder = setting('HUNGER_EMAIL_TEMPLATES_DIR')
-    templates_folder = os.path.join(templates_folder, '')
+    templates_folder = get_templates_folder()
     from_email = kwargs.get('from_email',
         getattr(settings, 'DEFAULT_FROM_EMAIL'))
     if templates_folder == 'hunger':
@@ -50,26 +130,98 @@ def beta_invite(email, code, request, **kwargs):
         file_extension = None
 
     if templated_email_available:
-        send_templated_mail(
-            template_name='invite_email',
-            from_email=from_email,
-            recipient_list=[email],
-            context=context_dict,
-            template_dir=templates_folder,
-            file_extension=file_extension,
-        )
+        with timer('hunger.email.send'):
+            send_templated_mail(
+                template_name='invite_email',
+                from_email=from_email,
+                recipient_list=[email],
+                context=context_dict,
+                template_dir=templates_folder,
+                file_extension=file_extension,
+            )
     else:
-        plaintext = get_template(
-            os.path.join(templates_folder, 'invite_email.txt'))
-        html = get_template(os.path.join(
-            templates_folder, 'invite_email.html'))
-
-        subject = get_template(os.path.join(templates_folder,
-            'invite_email_subject.txt')).render(context)
-        to = email
-        text_content = plaintext.render(context)
-        html_content = html.render(context)
-        msg = EmailMultiAlternatives(subject, text_content, from_email, [to],
-                                     headers={'From': '%s' % from_email})
-        msg.attach_alternative(html_content, "text/html")
-        msg.send()
+        with timer('hunger.email.render'):
+            templates = get_invite_templates(templates_folder)
+            msg = render_invite(templates, email, context_dict, from_email)
+        with timer('hunger.email.send'):
+            msg.send()
+
+
+def send_invites(queryset, request=None, chunk_size=500):
+    """
+    Mark every unused invitation in ``queryset`` as invited and email it.
+
+    ``invited`` is set with one UPDATE per chunk once the chunk's emails
+    are out, so a failed send leaves its chunk on the waitlist. The
+    emails are rendered with :func:`render_invites` and all go out over
+    a single mail connection.
+    When a custom ``HUNGER_EMAIL_INVITE_FUNCTION`` or
+    django-templated-email is in use, each invitation is dispatched
+    through the ``invite_sent`` signal instead. With ``HUNGER_EMAIL_QUEUE``
+    the emails are put in the outbox, one INSERT per chunk.
+
+    Returns a ``(sent, seconds)`` tuple.
+    """
+    from hunger.models import Invitation, atomic
+    from hunger.signals import invite_sent
+
+    def mark_invited(invitations, timestamp):
+        Invitation.objects.filter(pk__in=[inv.pk for inv in invitations]
+                                  ).update(invited=timestamp, position=None)
+        # The UPDATE bypasses the signals that keep the cache fresh.
+        status.invalidate(*[inv.user_id for inv in invitations])
+
+    start = time.time()
+    pks = list(queryset.filter(used__isnull=True)
+                       .values_list('pk', flat=True))
+    queued = setting('HUNGER_EMAIL_QUEUE')
+    bulk = (not queued and not templated_email_available and
+            setting('HUNGER_EMAIL_INVITE_FUNCTION') ==
+            'hunger.email.beta_invite')
+    if bulk:
+        connection = get_connection()
+        connection.open()
+
+    sent = 0
+    try:
+        for i in range(0, len(pks), chunk_size):
+            chunk = pks[i:i + chunk_size]
+            invitations = list(Invitation.objects.filter(
+                pk__in=chunk).select_related('code', 'user'))
+            timestamp = now()
+            for invitation in invitations:
+                invitation.invited = timestamp
+                invitation.position = None
+            if queued:
+                from hunger.outbox import enqueue_invitations
+                with atomic():
+                    sent += enqueue_invitations(invitations, request)
+                    mark_invited(invitations, timestamp)
+                continue
+
+            if not bulk:
+                done = []
+                try:
+                    for invitation in invitations:
+                        invite_sent.send(sender=Invitation,
+                                         invitation=invitation,
+                                         request=request,
+                                         user=invitation.user)
+                        done.append(invitation)
+                finally:
+                    mark_invited(done, timestamp)
+                sent += len(done)
+                continue
+
+            with timer('hunger.email.render_batch'):
+                messages = list(render_invites(invitations, request))
+            with timer('hunger.email.send_batch'):
+                batch_sent = connection.send_messages(messages) or 0
+            mark_invited(invitations, timestamp)
+            get_metrics().incr('hunger.email.sent', batch_sent)
+            sent += batch_sent
+    finally:
+        if bulk:
+            connection.close()
+
+    return sent, time.time() - start
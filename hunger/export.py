@@ -0,0 +1,132 @@
+"""
+Streaming CSV export of invitations, and allowlists of admitted users.
+
+Rows are read with a single joined ``values_list`` query per chunk, so
+memory use stays flat no matter how many invitations are exported.
+
+Allowlists are meant for gating at the edge, e.g. a reverse proxy. They
+come in two formats, both sorted by user id without duplicates:
+
+``text``
+    One ``<user id> <email>`` line per admitted user.
+``binary``
+    The 8 bytes ``HUNGERA1``, then each user id as a little-endian
+    signed 64-bit integer.
+
+Files are written next to their destination and renamed over it, so
+readers never see a partial file.
+"""
+import os
+import csv
+import zlib
+import struct
+import tempfile
+from contextlib import contextmanager
+
+from django.utils.encoding import smart_str
+
+from hunger.utils import chunked_values
+
+BINARY_MAGIC = b'HUNGERA1'
+
+HEADER = ['email', 'created', 'invited', 'used']
+
+
+class Echo(object):
+    """File-like object handing back what the csv writer writes."""
+
+    def write(self, value):
+        return value
+
+
+def format_datetime(value):
+    # Same as strftime("%Y-%m-%d %H:%M:%S"), without the per-call parsing.
+    return str(value)[:19] if value else ''
+
+
+def iter_csv(queryset, chunk_size=2000):
+    """Yield the invitations export as CSV, one string per chunk."""
+    writer = csv.writer(Echo())
+    yield writer.writerow(HEADER)
+    fields = ('user__email', 'email', 'created', 'invited', 'used')
+    for rows in chunked_values(queryset, fields, chunk_size):
+        yield ''.join(
+            writer.writerow([smart_str(user_email or email),
+                             format_datetime(created),
+                             format_datetime(invited),
+                             format_datetime(used)])
+            for user_email, email, created, invited, used in rows
+            if user_email or email)
+
+
+def iter_gzip(chunks, level=6):
+    """Gzip-compress an iterable of strings on the fly."""
+    compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+    for chunk in chunks:
+        if not isinstance(chunk, bytes):
+            chunk = chunk.encode('utf-8')
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def iter_admitted(queryset, chunk_size=2000):
+    """
+    Yield lists of ``(user id, email)`` for the users of ``queryset``.
+
+    Invitations are read in user id order, each chunk after the last id
+    of the previous one, which also skips the other invitations of a
+    user already yielded.
+    """
+    queryset = queryset.exclude(user=None).order_by('user')
+    last = None
+    while True:
+        page = queryset if last is None else queryset.filter(user__gt=last)
+        rows = list(page.values_list('user', 'user__email')[:chunk_size])
+        if not rows:
+            return
+        last = rows[-1][0]
+        unique = []
+        for row in rows:
+            if not unique or unique[-1][0] != row[0]:
+                unique.append(row)
+        yield unique
+
+
+def write_allowlist(f, chunks, binary=False):
+    """Write chunks of ``(user id, email)`` to ``f`` as an allowlist.
+
+    Returns the number of users written.
+    """
+    count = 0
+    if binary:
+        f.write(BINARY_MAGIC)
+    for rows in chunks:
+        if binary:
+            f.write(struct.pack('<%dq' % len(rows),
+                                *[pk for pk, email in rows]))
+        else:
+            f.write(''.join('%d %s\n' % (pk, smart_str(email))
+                            for pk, email in rows))
+        count += len(rows)
+    return count
+
+
+@contextmanager
+def atomic_file(path, mode=0o644):
+    """Write to a temporary file renamed over ``path`` on success."""
+    directory = os.path.dirname(os.path.abspath(path))
+    f = tempfile.NamedTemporaryFile(dir=directory, prefix='.hunger-',
+                                    delete=False)
+    try:
+        yield f
+        f.flush()
+        os.fsync(f.fileno())
+        f.close()
+        os.chmod(f.name, mode)
+        os.rename(f.name, path)
+    except:
+        f.close()
+        os.unlink(f.name)
+        raise
@@ -0,0 +1,127 @@
+"""
+Streaming import of waitlist emails.
+
+Rows are read lazily from CSV or JSON lines and imported in batches:
+emails are normalized with :func:`hunger.utils.normalize_email`, users
+and invitations are matched with one indexed ``email__in`` query each
+per batch, on the emails both as written in the file and normalized,
+and new invitations are inserted with ``bulk_create``, at the end of
+the waitlist. Rows stored with other capitalization than either are not
+recognised.
+
+Emails that already have an invitation, or belong to a user who does,
+are skipped. They are filtered out before the INSERT rather than left
+to the database, since invitation emails carry no unique constraint,
+so importing the same file twice creates nothing the second time.
+"""
+import csv
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.utils import six
+
+from hunger.models import Invitation, atomic
+from hunger.utils import get_user_model, normalize_email
+from hunger.waitlist import next_position
+
+
+def read_csv(lines):
+    """Yield the emails of CSV rows.
+
+    The first column is used, or the ``email`` column when the first
+    row is a header naming it.
+    """
+    column = 0
+    for i, row in enumerate(csv.reader(lines)):
+        if not row:
+            continue
+        if i == 0:
+            header = [value.strip().lower() for value in row]
+            if 'email' in header:
+                column = header.index('email')
+                continue
+        yield row[column] if len(row) > column else ''
+
+
+def read_jsonl(lines):
+    """Yield the emails of JSON lines, objects with an ``email`` key or
+    plain strings."""
+    for line in lines:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            value = json.loads(line)
+        except ValueError:
+            yield ''
+            continue
+        if isinstance(value, dict):
+            value = value.get('email')
+        yield value if isinstance(value, six.string_types) else ''
+
+
+def import_emails(emails, batch_size=500):
+    """
+    Create waiting invitations for ``emails``.
+
+    Returns a dict counting the ``rows`` read, the ``invalid`` and
+    ``duplicate`` ones skipped and the invitations ``created``.
+    """
+    stats = {'rows': 0, 'invalid': 0, 'duplicates': 0, 'created': 0}
+    batch = []
+    typed = set()
+    for value in emails:
+        stats['rows'] += 1
+        email = normalize_email(value)
+        try:
+            validate_email(email)
+        except ValidationError:
+            stats['invalid'] += 1
+            continue
+        batch.append(email)
+        typed.add(value.strip())
+        if len(batch) >= batch_size:
+            import_batch(batch, stats, typed)
+            batch = []
+            typed = set()
+    if batch:
+        import_batch(batch, stats, typed)
+    return stats
+
+
+def import_batch(emails, stats, typed=()):
+    """Import a batch of normalized ``emails``, ``typed`` holding other
+    spellings of them to look for among existing rows."""
+    unique = []
+    seen = set()
+    for email in emails:
+        if email not in seen:
+            seen.add(email)
+            unique.append(email)
+
+    lookup = seen.union(typed)
+    existing = set(normalize_email(email) for email in Invitation.objects
+                   .filter(email__in=lookup).values_list('email', flat=True))
+    users = dict((normalize_email(email), pk) for email, pk in
+                 get_user_model().objects.filter(email__in=lookup)
+                                         .values_list('email', 'pk'))
+    enrolled = set()
+    if users:
+        enrolled = set(Invitation.objects.filter(user__in=users.values())
+                                         .values_list('user', flat=True))
+
+    with atomic():
+        position = next_position()
+        invitations = []
+        for email in unique:
+            user_id = users.get(email)
+            if email in existing or (user_id and user_id in enrolled):
+                continue
+            invitations.append(Invitation(email=email, user_id=user_id,
+                                          position=position))
+            position += 1
+        Invitation.objects.bulk_create(invitations)
+
+    stats['duplicates'] += len(emails) - len(invitations)
+    stats['created'] += len(invitations)
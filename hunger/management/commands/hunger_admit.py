@@ -0,0 +1,71 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hunger.email import send_invites
+from hunger.models import Invitation
+from hunger.waitlist import next_in_line
+
+
+class Command(BaseCommand):
+    help = ('Invite the next waiting users, oldest first, and send their '
+            'invitation emails in batches.')
+    option_list = BaseCommand.option_list + (
+        make_option('--next', type='int', dest='next', default=0,
+                    help='Number of waiting invitations to admit.'),
+        make_option('--order', dest='order', default='created',
+                    choices=('created', 'pk'),
+                    help='Order of the waitlist: created (default) or pk.'),
+        make_option('--chunk-size', type='int', dest='chunk_size',
+                    default=500, help='Invitations per batch.'),
+        make_option('--rate', type='float', dest='rate', default=0,
+                    help='Send at most this many emails per second.'),
+        make_option('--dry-run', action='store_true', dest='dry_run',
+                    default=False,
+                    help='Only list the invitations that would be admitted.'),
+    )
+
+    def handle(self, *args, **options):
+        if options['next'] < 1:
+            raise CommandError('Give the number of users to admit with '
+                               '--next.')
+        rate = float(options['rate'])
+        chunk_size = options['chunk_size']
+        if rate:
+            # About a second's worth of emails per batch, so that the
+            # limit is kept without long bursts.
+            chunk_size = max(1, min(chunk_size, int(rate)))
+        verbosity = int(options['verbosity'])
+
+        start = time.time()
+        admitted = 0
+        for pks in next_in_line(options['next'], options['order'],
+                                chunk_size):
+            if options['dry_run']:
+                admitted += len(pks)
+                if verbosity > 1:
+                    for pk, email in Invitation.objects.filter(
+                            pk__in=pks).values_list('pk', 'email'):
+                        self.stdout.write('%s %s\n' % (pk, email))
+                continue
+
+            batch_start = time.time()
+            sent, seconds = send_invites(
+                Invitation.objects.filter(pk__in=pks), chunk_size=len(pks))
+            admitted += len(pks)
+            if verbosity > 1:
+                self.stdout.write('Admitted %d, %d emails sent.\n' % (
+                    admitted, sent))
+            if rate:
+                pause = sent / rate - (time.time() - batch_start)
+                if pause > 0:
+                    time.sleep(pause)
+
+        seconds = time.time() - start
+        if options['dry_run']:
+            self.stdout.write('Would admit %d invitations.\n' % admitted)
+        else:
+            self.stdout.write('Admitted %d invitations in %.2fs (%.1f/s).\n'
+                              % (admitted, seconds,
+                                 admitted / seconds if seconds else 0))
@@ -0,0 +1,40 @@
+import sys
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hunger.export import iter_csv, iter_gzip
+from hunger.models import Invitation
+
+
+class Command(BaseCommand):
+    args = '<file>'
+    help = 'Write the invitations CSV export to a file ("-" for stdout).'
+    option_list = BaseCommand.option_list + (
+        make_option('--gzip', action='store_true', dest='gzip',
+                    default=False, help='Gzip-compress the output.'),
+        make_option('--chunk-size', type='int', dest='chunk_size',
+                    default=2000, help='Rows fetched per query.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Give exactly one output file.')
+
+        chunks = iter_csv(Invitation.objects.all(),
+                          chunk_size=options['chunk_size'])
+        if options['gzip']:
+            chunks = iter_gzip(chunks)
+
+        if args[0] == '-':
+            out = getattr(sys.stdout, 'buffer', sys.stdout)
+        else:
+            out = open(args[0], 'wb')
+        try:
+            for chunk in chunks:
+                if not isinstance(chunk, bytes):
+                    chunk = chunk.encode('utf-8')
+                out.write(chunk)
+        finally:
+            if args[0] != '-':
+                out.close()
@@ -0,0 +1,74 @@
+import os
+import datetime
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Max
+from django.utils.dateparse import parse_datetime
+
+from hunger.export import atomic_file, iter_admitted, write_allowlist
+from hunger.snapshot import admitted
+from hunger.utils import setting
+
+
+class Command(BaseCommand):
+    args = '<file>'
+    help = ('Write the admitted users allowlist, sorted by user id, and '
+            'atomically replace the file.')
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='format', default='text',
+                    choices=('text', 'binary'),
+                    help='text (id and email per line) or binary (ids).'),
+        make_option('--delta', action='store_true', dest='delta',
+                    default=False,
+                    help='Write the users admitted since the last full '
+                         'export, as recorded in <file>.since, to '
+                         '<file>.delta and leave <file> alone.'),
+        make_option('--chunk-size', type='int', dest='chunk_size',
+                    default=2000, help='Rows fetched per query.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Give exactly one output file.')
+        path = args[0]
+        since_path = '%s.since' % path
+        delta_path = '%s.delta' % path
+        binary = options['format'] == 'binary'
+
+        queryset = admitted()
+        if options['delta']:
+            if not os.path.exists(since_path):
+                raise CommandError('No full export of %s to add a delta '
+                                   'to, run without --delta first.' % path)
+            with open(since_path) as f:
+                # Empty when nobody was admitted at the full export.
+                since = parse_datetime(f.read().strip())
+            if since is not None:
+                # Everything since the full export, so each delta
+                # replaces the previous one. Late commits are reread.
+                queryset = queryset.filter(
+                    used__gte=since - datetime.timedelta(
+                        seconds=setting('HUNGER_SNAPSHOT_OVERLAP')))
+            with atomic_file(delta_path) as f:
+                count = write_allowlist(
+                    f, iter_admitted(queryset, options['chunk_size']),
+                    binary=binary)
+            self.stdout.write('Wrote %d admitted users to the delta %s.\n'
+                              % (count, delta_path))
+            return
+
+        # Taken first: rows used after it go into the deltas.
+        high_water = queryset.aggregate(last=Max('used'))['last']
+        with atomic_file(path) as f:
+            count = write_allowlist(
+                f, iter_admitted(queryset, options['chunk_size']),
+                binary=binary)
+        with atomic_file(since_path) as f:
+            f.write(str(high_water or '').encode('ascii'))
+        if os.path.exists(delta_path):
+            # The full export has all of it now.
+            with atomic_file(delta_path) as f:
+                write_allowlist(f, [], binary=binary)
+        self.stdout.write('Wrote %d admitted users to the allowlist %s.\n'
+                          % (count, path))
@@ -0,0 +1,46 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hunger.codes import generate_codes
+
+
+class Command(BaseCommand):
+    help = 'Create invitation codes in bulk.'
+    option_list = BaseCommand.option_list + (
+        make_option('--count', type='int', dest='count',
+                    help='Number of codes to create.'),
+        make_option('--max-invites', type='int', dest='max_invites',
+                    default=1, help='Invitations allowed per code.'),
+        make_option('--public', action='store_false', dest='private',
+                    default=True, help='Create public codes.'),
+        make_option('--batch-size', type='int', dest='batch_size',
+                    default=500, help='Codes inserted per query.'),
+        make_option('--output', dest='output',
+                    help='File to write the new codes to, one per line.'),
+    )
+
+    def handle(self, *args, **options):
+        if not options['count'] or options['count'] < 1:
+            raise CommandError('--count must be a positive number.')
+
+        out = options['output'] and open(options['output'], 'w')
+        start = time.time()
+        created = 0
+        try:
+            for codes in generate_codes(options['count'],
+                                        max_invites=options['max_invites'],
+                                        batch_size=options['batch_size'],
+                                        private=options['private']):
+                created += len(codes)
+                if out:
+                    out.write(''.join('%s\n' % code for code in codes))
+        finally:
+            if out:
+                out.close()
+
+        seconds = time.time() - start
+        rate = created / seconds if seconds else 0
+        self.stdout.write('Created %d codes in %.2fs (%.0f codes/s).\n' % (
+            created, seconds, rate))
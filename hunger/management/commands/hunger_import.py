@@ -0,0 +1,60 @@
+import sys
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand, CommandError
+
+from hunger.importer import import_emails, read_csv, read_jsonl
+
+try:
+    import resource
+except ImportError:
+    # Not available on Windows.
+    resource = None
+
+
+def peak_memory():
+    """The process' memory high-water mark in kB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux counts kilobytes, macOS bytes.
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+class Command(BaseCommand):
+    args = '<file>'
+    help = ('Put the emails of a CSV or JSON lines file ("-" for stdin) '
+            'on the waitlist.')
+    option_list = BaseCommand.option_list + (
+        make_option('--format', dest='format', default=None,
+                    choices=('csv', 'jsonl'),
+                    help='csv or jsonl, by default from the file name.'),
+        make_option('--batch-size', type='int', dest='batch_size',
+                    default=500, help='Emails inserted per query.'),
+    )
+
+    def handle(self, *args, **options):
+        if len(args) != 1:
+            raise CommandError('Give exactly one file to import.')
+
+        fmt = options['format']
+        if fmt is None:
+            fmt = 'jsonl' if args[0].endswith(('.jsonl', '.json')) else 'csv'
+        read = read_jsonl if fmt == 'jsonl' else read_csv
+
+        f = sys.stdin if args[0] == '-' else open(args[0], 'rb')
+        start = time.time()
+        try:
+            stats = import_emails(read(f), batch_size=options['batch_size'])
+        finally:
+            if args[0] != '-':
+                f.close()
+        seconds = time.time() - start
+
+        self.stdout.write(
+            'Imported %d of %d rows in %.2fs (%.1f rows/s), skipped %d '
+            'duplicates and %d invalid emails.\n' % (
+                stats['created'], stats['rows'], seconds,
+                stats['rows'] / seconds if seconds else 0,
+                stats['duplicates'], stats['invalid']))
+        if resource is not None:
+            self.stdout.write('Peak memory: %d kB.\n' % peak_memory())
@@ -0,0 +1,23 @@
+import json
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from hunger.metrics import get_metrics
+
+
+class Command(BaseCommand):
+    help = ('Print the aggregated hunger metrics as JSON. With the default '
+            'in-memory backend these are the metrics of this process only; '
+            'use hunger.metrics.CacheMetrics to see those of all processes.')
+    option_list = BaseCommand.option_list + (
+        make_option('--reset', action='store_true', dest='reset',
+                    default=False, help='Clear the metrics after printing.'),
+    )
+
+    def handle(self, *args, **options):
+        metrics = get_metrics()
+        self.stdout.write(json.dumps(metrics.snapshot(), indent=2,
+                                     sort_keys=True) + '\n')
+        if options['reset']:
+            metrics.reset()
@@ -0,0 +1,21 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from hunger.waitlist import rebuild
+
+
+class Command(BaseCommand):
+    help = ('Renumber waitlist positions, closing the gaps left by '
+            'invited users.')
+    option_list = BaseCommand.option_list + (
+        make_option('--chunk-size', type='int', dest='chunk_size',
+                    default=1000, help='Invitations renumbered per query.'),
+    )
+
+    def handle(self, *args, **options):
+        start = time.time()
+        count = rebuild(options['chunk_size'])
+        self.stdout.write('Ranked %d waiting invitations in %.2fs.\n' % (
+            count, time.time() - start))
@@ -0,0 +1,38 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+
+from hunger.models import InvitationCode
+from hunger.utils import chunked_values
+
+
+class Command(BaseCommand):
+    help = ('Recount the invited users of every invitation code and fix '
+            'counters that drifted.')
+    option_list = BaseCommand.option_list + (
+        make_option('--dry-run', action='store_true', dest='dry_run',
+                    default=False, help='Only report drifted counters.'),
+        make_option('--chunk-size', type='int', dest='chunk_size',
+                    default=1000, help='Codes checked per query.'),
+    )
+
+    def handle(self, *args, **options):
+        queryset = InvitationCode.objects.annotate(
+            actual=Count('invitation__user'))
+        drifted = 0
+        for rows in chunked_values(queryset, ('pk', 'num_invited', 'actual'),
+                                   options['chunk_size']):
+            for pk, num_invited, actual in rows:
+                if num_invited == actual:
+                    continue
+                drifted += 1
+                if int(options['verbosity']) > 1:
+                    self.stdout.write('Code %s: %d counted, %d actual\n' % (
+                        pk, num_invited, actual))
+                if not options['dry_run']:
+                    InvitationCode.objects.filter(pk=pk).update(
+                        num_invited=actual)
+
+        action = 'Found' if options['dry_run'] else 'Fixed'
+        self.stdout.write('%s %d drifted counters.\n' % (action, drifted))
@@ -0,0 +1,35 @@
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from hunger.email import send_invites
+from hunger.models import Invitation
+
+
+class Command(BaseCommand):
+    args = '[invitation_id ...]'
+    help = ('Send invitation emails in bulk, to the given invitations or '
+            'to every pending one.')
+    option_list = BaseCommand.option_list + (
+        make_option('--pending', action='store_true', dest='pending',
+                    default=False,
+                    help='Invite every invitation not invited yet.'),
+        make_option('--chunk-size', type='int', dest='chunk_size',
+                    default=500, help='Invitations per batch.'),
+    )
+
+    def handle(self, *args, **options):
+        queryset = Invitation.objects.all()
+        if args:
+            queryset = queryset.filter(pk__in=args)
+        elif options['pending']:
+            queryset = queryset.filter(invited__isnull=True)
+        else:
+            self.stderr.write('Give invitation ids or --pending.\n')
+            return
+
+        sent, seconds = send_invites(queryset,
+                                     chunk_size=options['chunk_size'])
+        rate = sent / seconds if seconds else 0
+        self.stdout.write('Sent %d invitations in %.2fs (%.1f/s).\n' % (
+            sent, seconds, rate))
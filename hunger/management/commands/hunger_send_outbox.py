@@ -0,0 +1,44 @@
+import time
+from optparse import make_option
+
+from django.core.management.base import BaseCommand
+
+from hunger.outbox import process_outbox
+
+
+class Command(BaseCommand):
+    help = 'Send the invitation emails waiting in the outbox.'
+    option_list = BaseCommand.option_list + (
+        make_option('--threads', type='int', dest='threads', default=4,
+                    help='Number of sending threads.'),
+        make_option('--batch-size', type='int', dest='batch_size',
+                    default=100, help='Emails claimed per batch.'),
+        make_option('--max-attempts', type='int', dest='max_attempts',
+                    default=5, help='Attempts before giving up on an email.'),
+        make_option('--backoff', type='int', dest='backoff', default=60,
+                    help='Base retry delay in seconds, doubled per attempt.'),
+        make_option('--loop', action='store_true', dest='loop',
+                    default=False,
+                    help='Keep polling the outbox instead of exiting.'),
+        make_option('--interval', type='float', dest='interval', default=5,
+                    help='Seconds between polls with --loop.'),
+    )
+
+    def handle(self, *args, **options):
+        sent = failed = 0
+        while True:
+            result = process_outbox(
+                batch_size=options['batch_size'],
+                threads=options['threads'],
+                max_attempts=options['max_attempts'],
+                backoff=options['backoff'],
+            )
+            if result is not None:
+                sent += result[0]
+                failed += result[1]
+                continue
+            if not options['loop']:
+                break
+            time.sleep(options['interval'])
+
+        self.stdout.write('Sent %d emails, %d failed.\n' % (sent, failed))
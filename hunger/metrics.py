@@ -0,0 +1,174 @@
+"""
+Counters and timings for hunger's hot paths.
+
+``HUNGER_METRICS_BACKEND`` is the dotted path of a class providing
+``incr(name, count=1)``, ``timing(name, seconds)``, ``snapshot()`` and
+``reset()``. The default, :class:`LocMemMetrics`, aggregates in
+process memory; :class:`CacheMetrics` aggregates in the Django cache
+named by ``HUNGER_METRICS_CACHE`` so that all processes share their
+numbers; :class:`NullMetrics` turns instrumentation off.
+
+Metric names:
+
+``hunger.middleware.<branch>``
+    Decisions of ``BetaMiddleware.process_view``, per branch.
+``hunger.invite_sent``
+    Dispatches of ``invitation_code_sent``.
+``hunger.email.render`` and ``hunger.email.send``
+    Rendering and sending of ``beta_invite`` emails.
+``hunger.email.render_batch``, ``hunger.email.send_batch`` and ``hunger.email.sent``
+    Batches of ``send_invites`` and the number of emails they sent.
+"""
+import threading
+from contextlib import contextmanager
+from timeit import default_timer
+
+from django.core.cache import get_cache
+from django.test.signals import setting_changed
+
+from hunger.utils import setting, import_path
+
+
+class NullMetrics(object):
+
+    def incr(self, name, count=1):
+        pass
+
+    def timing(self, name, seconds):
+        pass
+
+    def snapshot(self):
+        return {'counters': {}, 'timings': {}}
+
+    def reset(self):
+        pass
+
+
+def summarize(count, total, low, high):
+    return {
+        'count': count,
+        'total': total,
+        'mean': total / count if count else 0,
+        'min': low,
+        'max': high,
+    }
+
+
+class LocMemMetrics(object):
+    """Aggregates metrics in the memory of the current process."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def incr(self, name, count=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + count
+
+    def timing(self, name, seconds):
+        with self._lock:
+            stats = self._timings.get(name)
+            if stats is None:
+                self._timings[name] = [1, seconds, seconds, seconds]
+            else:
+                stats[0] += 1
+                stats[1] += seconds
+                stats[2] = min(stats[2], seconds)
+                stats[3] = max(stats[3], seconds)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'counters': dict(self._counters),
+                'timings': dict((name, summarize(*stats))
+                                for name, stats in self._timings.items()),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._counters = {}
+            self._timings = {}
+
+
+class CacheMetrics(object):
+    """
+    Aggregates metrics in a Django cache shared by all processes.
+
+    Timings keep a count and a total in microseconds, so only the mean
+    is available. Every event costs a cache round trip.
+    """
+    NAMES_KEY = 'hunger:metrics:names'
+    TIMEOUT = 60 * 60 * 24 * 30
+
+    def __init__(self):
+        self.cache = get_cache(setting('HUNGER_METRICS_CACHE'))
+        self._names = set()
+
+    def _add(self, key, value):
+        try:
+            self.cache.incr(key, value)
+        except ValueError:
+            if not self.cache.add(key, value, self.TIMEOUT):
+                self.cache.incr(key, value)
+            self._register(key)
+
+    def _register(self, key):
+        if key not in self._names:
+            names = self.cache.get(self.NAMES_KEY) or []
+            if key not in names:
+                self.cache.set(self.NAMES_KEY, names + [key], self.TIMEOUT)
+            self._names.add(key)
+
+    def incr(self, name, count=1):
+        self._add('hunger:metrics:c:%s' % name, count)
+
+    def timing(self, name, seconds):
+        self._add('hunger:metrics:n:%s' % name, 1)
+        self._add('hunger:metrics:t:%s' % name, int(seconds * 1e6))
+
+    def snapshot(self):
+        keys = self.cache.get(self.NAMES_KEY) or []
+        values = self.cache.get_many(keys)
+        counters, timings = {}, {}
+        for key, value in values.items():
+            kind, name = key.split(':', 3)[2:]
+            if kind == 'c':
+                counters[name] = value
+            elif kind == 'n':
+                total = values.get('hunger:metrics:t:%s' % name, 0) / 1e6
+                timings[name] = summarize(value, total, None, None)
+        return {'counters': counters, 'timings': timings}
+
+    def reset(self):
+        self.cache.delete_many(
+            (self.cache.get(self.NAMES_KEY) or []) + [self.NAMES_KEY])
+        self._names = set()
+
+
+_backend = []
+
+
+def get_metrics():
+    """Return the process-wide metrics backend."""
+    if not _backend:
+        _backend.append(import_path(setting('HUNGER_METRICS_BACKEND'))())
+    return _backend[0]
+
+
+@contextmanager
+def timer(name):
+    """Count and time the enclosed block under ``name``."""
+    start = default_timer()
+    try:
+        yield
+    finally:
+        metrics = get_metrics()
+        metrics.incr(name)
+        metrics.timing(name, default_timer() - start)
+
+
+def reset_backend(sender, **kwargs):
+    if kwargs['setting'] in ('HUNGER_METRICS_BACKEND', 'HUNGER_METRICS_CACHE'):
+        del _backend[:]
+
+setting_changed.connect(reset_backend)
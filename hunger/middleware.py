@@ -1,15 +1,31 @@
+import re
+import fnmatch
 import logging
+from timeit import default_timer
 
 from django.conf import settings
 from django.core.urlresolvers import resolve
 from django.shortcuts import redirect
 
-from hunger.models import InvitationCode, Invitation
+from hunger import codecache, codes, status, tokens
+from hunger.metrics import get_metrics
+from hunger.snapshot import get_snapshot
+from hunger.models import Invitation
 from hunger.utils import setting, now
 
 
 logger = logging.getLogger(__name__)
 
+WHITELISTED_MODULES = (
+    'django.contrib.auth.views',
+    'django.contrib.admin.sites',
+    'django.views.static',
+    'django.contrib.staticfiles.views',
+    'hunger.views',
+)
+
+GLOB_CHARS = re.compile(r'[*?\[]')
+
 
 def invite_from_cookie_and_email(request):
     #print 90
@@ -20,18 +36,20 @@ def invite_from_cookie_and_email(request):
         return False
 
     # No invitation, all we have is this cookie code
-    try:
-        code = InvitationCode.objects.get(
-            code=cookie_code, num_invites__gt=0)
-    except InvitationCode.DoesNotExist:
+    cookie_code = codes.check_code(cookie_code)
+    code_id = codecache.lookup(cookie_code) if cookie_code else None
+    if code_id is None:
         #print "invalid cookie code"
         request._hunger_delete_cookie = True
         return False
 
+    # Cached under the normalized code, see codecache.forget below.
+    request._hunger_code = cookie_code
+
     # try to get the email for the code
     try:
         invite = Invitation.objects.get(
-            code=code,
+            code_id=code_id,
             email=request.user.email
         )
     except Invitation.DoesNotExist:
@@ -42,6 +60,74 @@ def invite_from_cookie_and_email(request):
     return invite
 
 
+class AllowList(object):
+    """
+    Precompiled always-allow rules used by :class:`BetaMiddleware`.
+
+    Views, modules and flatpages are held in frozensets and the verdict
+    for each view callable is memoized, so checking a request costs a
+    few hash lookups instead of rebuilding and scanning lists.
+
+    Module entries may be glob patterns (``myapp.*``,
+    ``myapp.views.api_?``), which are matched once per view callable.
+
+    Path prefixes are kept as one tuple for ``str.startswith``, leaving
+    out prefixes that a shorter one already covers.
+    """
+
+    def __init__(self, views=(), modules=(), flatpages=(),
+                 append_slash=True, prefixes=()):
+        self.views = frozenset(views)
+        kept = []
+        for prefix in sorted(set(prefixes)):
+            if not kept or not prefix.startswith(kept[-1]):
+                kept.append(prefix)
+        self.prefixes = tuple(kept)
+        self.flatpages = frozenset(flatpages)
+        self.append_slash = append_slash
+        exact = set(WHITELISTED_MODULES)
+        patterns = []
+        for module in modules:
+            if GLOB_CHARS.search(module):
+                patterns.append(re.compile(fnmatch.translate(module)).match)
+            else:
+                exact.add(module)
+        self.modules = frozenset(exact)
+        self.module_patterns = tuple(patterns)
+        self._memo = {}
+
+    def allows_prefix(self, path):
+        return bool(self.prefixes) and path.startswith(self.prefixes)
+
+    def allows_flatpage(self, path):
+        if not self.flatpages:
+            return False
+        return (path in self.flatpages or
+                (self.append_slash and '%s/' % path in self.flatpages))
+
+    def allows_callable(self, view_func):
+        """Whether the view's module or full name is always allowed."""
+        try:
+            return self._memo[view_func]
+        except KeyError:
+            allowed = self._memo[view_func] = self._check_callable(view_func)
+            return allowed
+        except TypeError:
+            # Unhashable callable, nothing to memoize on.
+            return self._check_callable(view_func)
+
+    def _check_callable(self, view_func):
+        module = '%s' % view_func.__module__
+        if module in self.modules:
+            return True
+        if any(match(module) for match in self.module_patterns):
+            return True
+        short_name = view_func.__class__.__name__
+        if short_name == 'function':
+            short_name = view_func.__name__
+        return '%s.%s' % (module, short_name) in self.views
+
+
 class BetaMiddleware(object):
     """
     Add this to your ``MIDDLEWARE_CLASSES`` make all views except for
@@ -64,10 +150,40 @@ class BetaMiddleware(object):
     ``HUNGER_ALWAYS_ALLOW_MODULES``
         A list of modules that should always pass through.  All
         views in ``django.contrib.auth.views``, ``django.views.static``
-        and ``hunger.views`` will pass through.
+        and ``hunger.views`` will pass through. Entries may be glob
+        patterns such as ``myapp.api.*``.
+
+    ``HUNGER_ALWAYS_ALLOW_PREFIXES``
+        A list of URL path prefixes, such as ``'/static/'``, let
+        through in ``process_request``, before hunger resolves the view
+        or touches the session or the user.
 
     ``HUNGER_REDIRECT``
         The redirect when not in beta.
+
+    ``HUNGER_BETA_CACHE``
+        Name of a cache used to remember admitted users by id, so
+        fresh sessions skip the invitation queries. Disabled by
+        default. Entries expire after ``HUNGER_BETA_CACHE_TIMEOUT``
+        seconds.
+
+    ``HUNGER_ADMITTED_SNAPSHOT``
+        Whether every process keeps the ids of admitted users in memory
+        (see :mod:`hunger.snapshot`) and lets them through once the user
+        is loaded, without reading their invitations. Default is
+        `False`.
+
+    ``HUNGER_CODE_CACHE``
+        Name of a cache remembering which ``hunger_code`` cookie codes
+        are usable (see :mod:`hunger.codecache`). Disabled by default.
+
+    ``HUNGER_ADMISSION_TOKEN``
+        Whether admitted users get a signed, expiring admission token
+        (see :mod:`hunger.tokens`) that lets later requests of the same
+        user through without querying invitations. Default is `False`.
+
+    Every decision is counted and timed under
+    ``hunger.middleware.<branch>`` in :mod:`hunger.metrics`.
     """
 
     def __init__(self):
@@ -76,58 +192,82 @@ class BetaMiddleware(object):
         self.always_allow_modules = setting('HUNGER_ALWAYS_ALLOW_MODULES')
         self.redirect = setting('HUNGER_REDIRECT')
         self.allow_flatpages = setting('HUNGER_ALLOW_FLATPAGES')
+        self.admission_token = setting('HUNGER_ADMISSION_TOKEN')
+        self.allow_list = AllowList(
+            views=self.always_allow_views,
+            modules=self.always_allow_modules,
+            flatpages=self.allow_flatpages,
+            append_slash=getattr(settings, 'APPEND_SLASH', True),
+            prefixes=setting('HUNGER_ALWAYS_ALLOW_PREFIXES'),
+        )
+        self.snapshot = get_snapshot()
+
+    def process_request(self, request):
+        if not self.enable_beta:
+            return
+        start = default_timer()
+        if self.allow_list.allows_prefix(request.path_info):
+            request._hunger_allowed = True
+            metrics = get_metrics()
+            metrics.incr('hunger.middleware.prefix')
+            metrics.timing('hunger.middleware.prefix',
+                           default_timer() - start)
 
     def process_view(self, request, view_func, view_args, view_kwargs):
         #print 0
-        if not self.enable_beta:
+        if not self.enable_beta or getattr(request, '_hunger_allowed', False):
             return
 
+        start = default_timer()
+        branch, response = self._check(request, view_func)
+        name = 'hunger.middleware.%s' % branch
+        metrics = get_metrics()
+        metrics.incr(name)
+        metrics.timing(name, default_timer() - start)
+        return response
+
+    def _check(self, request, view_func):
+        """Return the ``(branch, response)`` deciding on the request."""
         #print 1
-        if (request.path in self.allow_flatpages or
-            (getattr(settings, 'APPEND_SLASH', True) and
-             '%s/' % request.path in self.allow_flatpages)):
+        if self.allow_list.allows_flatpage(request.path):
             from django.contrib.flatpages.views import flatpage
             #print "returning flatpage!"
-            return flatpage(request, request.path_info)
+            return 'flatpage', flatpage(request, request.path_info)
 
         #print 2
-        whitelisted_modules = ['django.contrib.auth.views',
-                               'django.contrib.admin.sites',
-                               'django.views.static',
-                               'django.contrib.staticfiles.views',
-                               'hunger.views']
-
-        short_name = view_func.__class__.__name__
-        if short_name == 'function':
-            short_name = view_func.__name__
-        view_name = self._get_view_name(request)
-
-        full_view_name = '%s.%s' % (view_func.__module__, short_name)
-
-        if self.always_allow_modules:
-            whitelisted_modules += self.always_allow_modules
-
-        if '%s' % view_func.__module__ in whitelisted_modules:
+        if self.allow_list.allows_callable(view_func):
             #print "whitelisted"
-            return
+            return 'whitelisted', None
 
         #print 3
-        if (full_view_name in self.always_allow_views or
-                view_name in self.always_allow_views):
-            return
+        if self._get_view_name(request) in self.allow_list.views:
+            return 'always_allow_view', None
 
         #print 4
         if not request.user.is_authenticated():
-            return redirect(self.redirect)
+            return 'anonymous', redirect(self.redirect)
 
         #print 5
         if request.user.is_staff:
-            return
+            return 'staff', None
         #print 6
 
+        if self.admission_token:
+            token = tokens.get_token(request)
+            if token and tokens.check_token(token, request.user.pk):
+                return 'token', None
+
+        if self.snapshot is not None:
+            self.snapshot.maybe_refresh()
+            if request.user.pk in self.snapshot:
+                return 'snapshot', None
+
         # Prevent queries by caching in_beta status in session
         if request.session.get('hunger_in_beta'):
-            return
+            return 'session', None
+
+        if status.get_status(request.user.pk) == status.IN_BETA:
+            return 'status_cache', None
 
         #print 7
 
@@ -143,14 +283,15 @@ class BetaMiddleware(object):
                 email=request.user.email
             )
             invitation.save()
-            return redirect(self.redirect)
+            return 'enrolled', redirect(self.redirect)
 
         #print 8
 
-        if any([i.used for i in invitations]):
+        used = [i for i in invitations if i.used]
+        if used:
             #print "some are used, therefore we are in Beta"
-            request.session['hunger_in_beta'] = True
-            return
+            self._admit(request, used[0])
+            return 'used', None
 
         #print 9
 
@@ -160,23 +301,44 @@ class BetaMiddleware(object):
             #print "let's activate"
             invitation.used = now()
             invitation.save()
-            request.session['hunger_in_beta'] = True
-            return
+            self._admit(request, invitation)
+            return 'activated', None
 
         #print 10
         # get from cookie, assume is authenticated and has email.
         invite = invite_from_cookie_and_email(request)
+        if invite and invite.accept_invite(request.user):
+            self._admit(request, invite)
+            return 'cookie_accepted', None
         if invite:
-            invite.accept_invite(request.user)
-            return
-        else:
-            return redirect(self.redirect)
+            # Somebody else took the last use of the code.
+            request._hunger_delete_cookie = True
+            codecache.forget(request._hunger_code)
+        return 'waiting', redirect(self.redirect)
 
     def process_response(self, request, response):
         if getattr(request, '_hunger_delete_cookie', False):
             response.delete_cookie('hunger_code')
+        if getattr(request, '_hunger_forget_token', False):
+            response.delete_cookie(setting('HUNGER_ADMISSION_TOKEN_COOKIE'))
+        token = getattr(request, '_hunger_admission_token', None)
+        if token:
+            max_age = setting('HUNGER_ADMISSION_TOKEN_MAX_AGE')
+            response.set_cookie(setting('HUNGER_ADMISSION_TOKEN_COOKIE'),
+                                token, max_age=max_age, httponly=True)
+            response[setting('HUNGER_ADMISSION_TOKEN_HEADER')] = token
         return response
 
+    def _admit(self, request, invitation):
+        """Remember that the user is in beta."""
+        request.session['hunger_in_beta'] = True
+        status.set_status(request.user.pk)
+        if self.snapshot is not None:
+            self.snapshot.add(request.user.pk)
+        if self.admission_token:
+            request._hunger_admission_token = tokens.make_token(
+                request.user.pk, invitation.pk, invitation.token_version)
+
     @staticmethod
     def _get_view_name(request):
         """Return the urlpattern name."""
@@ -1,25 +1,45 @@
-import string
-import random
-
-from django.db import models
+import django
+from django.contrib.auth.signals import user_logged_in, user_logged_out
+from django.db import models, transaction
+from django.db.models import F
+from django.db.models.signals import post_init, post_save, post_delete
 from django.utils.translation import ugettext_lazy as _
 
 from hunger.utils import setting
-from hunger.signals import invite_sent
+from hunger.signals import (invite_sent, remember_counted_code,
+                            invitation_counted, invitation_uncounted)
+from hunger.status import invitation_changed
+from hunger.codecache import code_changed
+from hunger.tokens import forget_token
+from hunger.claims import user_saved, user_logged_in as claim_on_login
 
 User = setting('AUTH_USER_MODEL')
 
+# Django < 1.6 has no transaction.atomic.
+atomic = getattr(transaction, 'atomic', transaction.commit_on_success)
+
 
 class Invitation(models.Model):
     user = models.ForeignKey(User, blank=True, null=True)
-    email = models.EmailField(_('Email'), blank=True)
+    email = models.EmailField(_('Email'), blank=True, db_index=True)
     code = models.ForeignKey('InvitationCode', blank=True, null=True)
-    used = models.DateTimeField(_('Used'), blank=True, null=True)
-    invited = models.DateTimeField(_('Invited'), blank=True, null=True)
-    created = models.DateTimeField(_('Created'), auto_now_add=True)
+    used = models.DateTimeField(_('Used'), blank=True, null=True,
+        db_index=True)
+    invited = models.DateTimeField(_('Invited'), blank=True, null=True,
+        db_index=True)
+    created = models.DateTimeField(_('Created'), auto_now_add=True,
+        db_index=True)
+    token_version = models.PositiveIntegerField(
+        _('Admission token version'), default=0)
+    position = models.PositiveIntegerField(_('Waitlist position'),
+        blank=True, null=True, db_index=True, editable=False)
 
     class Meta:
         unique_together = (('user', 'code'),)
+        # Django < 1.5 has no index_together, the South migrations
+        # create these indexes on every version.
+        if django.VERSION >= (1, 5):
+            index_together = (('code', 'email'),)
 
     def __unicode__(self):
         return "user:%s email:%s code:%s used:%s invited:%s" % (
@@ -36,24 +56,51 @@ class Invitation(models.Model):
             request = kwargs.pop('request', None)
             invite_sent.send(sender=self.__class__, invitation=self,
                              request=request, user=self.user)
+        if self.invited or self.used:
+            self.position = None
+        elif self.pk is None and self.position is None:
+            from hunger.waitlist import next_position
+            self.position = next_position()
         super(Invitation, self).save(*args, **kwargs)
 
     def accept_invite(self, user):
         """
         When we have an invite with just a code and email,
         We can add the user to it.
+
+        One of the code's remaining invitations is taken with a single
+        conditional UPDATE, so concurrent redemptions can never
+        oversubscribe it. Returns False when the code has run out.
         """
         assert user.email == self.email
-        assert self.code is not None
+        assert self.code_id is not None
 
         from hunger.utils import now
-        self.user = user
-        self.used = now()
-        self.invited = now()
-        self.save()
-        self.code.num_invites -= 1
-        self.code.save()
-        #print "we used the code", self.code
+        with atomic():
+            redeemed = InvitationCode.objects.filter(
+                pk=self.code_id, num_invites__gt=0,
+            ).update(num_invites=F('num_invites') - 1)
+            if not redeemed:
+                return False
+            self.user = user
+            self.used = now()
+            self.invited = now()
+            if django.VERSION >= (1, 5):
+                self.save(update_fields=['user', 'used', 'invited',
+                                         'position'])
+            else:
+                # Django < 1.5 cannot save a subset of the fields.
+                self.save()
+        return True
+
+    def revoke_tokens(self):
+        """Invalidate the admission tokens issued for this invitation."""
+        from hunger import tokens
+        Invitation.objects.filter(pk=self.pk).update(
+            token_version=F('token_version') + 1)
+        self.token_version = Invitation.objects.filter(
+            pk=self.pk).values_list('token_version', flat=True)[0]
+        tokens.revoke(self.pk, self.token_version)
 
 
 class InvitationCode(models.Model):
@@ -63,23 +110,75 @@ class InvitationCode(models.Model):
         _('Max number of invitations'), default=1)
     num_invites = models.PositiveIntegerField(
         _('Remaining invitations'), default=1)
+    num_invited = models.PositiveIntegerField(
+        _('Invited users'), default=0, editable=False)
     invited_users = models.ManyToManyField(User,
         related_name='invitations', through='Invitation')
     owner = models.ForeignKey(User, related_name='created_invitations',
         blank=True, null=True)
 
+    class Meta:
+        if django.VERSION >= (1, 5):
+            index_together = (('owner', 'num_invites'),)
+
     def __unicode__(self):
         return self.code
 
     def remaining_invites(self):
         """The number of invites remaining for this code."""
-        return max([0, self.max_invites - self.invited_users.count()])
+        return max([0, self.max_invites - self.num_invited])
 
     def generate_invite_code(self):
-        return ''.join(random.choice(string.letters) for i in range(16))
+        from hunger.codes import new_codes
+        return new_codes(1)[0]
 
     def save(self, *args, **kwargs):
         if not self.code:
             self.code = self.generate_invite_code()
         # self.num_invites = self.max_invites - self.invited_users.count()
         super(InvitationCode, self).save(*args, **kwargs)
+
+
+class InvitationEmail(models.Model):
+    """An invitation email waiting in the outbox, see hunger.outbox."""
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = (
+        (PENDING, _('Pending')),
+        (SENT, _('Sent')),
+        (FAILED, _('Failed')),
+    )
+
+    email = models.EmailField(_('Email'))
+    code = models.CharField(_('Invitation code'), max_length=30, blank=True)
+    invite_url = models.CharField(_('Invite URL'), max_length=255)
+    status = models.CharField(_('Status'), max_length=10,
+        choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveIntegerField(_('Attempts'), default=0)
+    next_attempt = models.DateTimeField(_('Next attempt'), db_index=True)
+    claim = models.CharField(max_length=32, blank=True)
+    last_error = models.TextField(_('Last error'), blank=True)
+    created = models.DateTimeField(_('Created'), auto_now_add=True)
+    sent = models.DateTimeField(_('Sent'), blank=True, null=True)
+
+    def __unicode__(self):
+        return "email:%s code:%s status:%s attempts:%s" % (
+            self.email,
+            self.code,
+            self.status,
+            self.attempts,
+        )
+
+
+post_save.connect(invitation_changed, sender=Invitation)
+post_delete.connect(invitation_changed, sender=Invitation)
+post_init.connect(remember_counted_code, sender=Invitation)
+post_save.connect(invitation_counted, sender=Invitation)
+post_delete.connect(invitation_uncounted, sender=Invitation)
+post_save.connect(code_changed, sender=InvitationCode)
+# Sent for every model, user_saved only acts on the user model.
+post_save.connect(user_saved)
+user_logged_in.connect(claim_on_login)
+user_logged_in.connect(forget_token)
+user_logged_out.connect(forget_token)
@@ -0,0 +1,150 @@
+"""
+Outbox for invitation emails.
+
+With ``HUNGER_EMAIL_QUEUE`` enabled, invitation emails are stored as
+:class:`~hunger.models.InvitationEmail` rows instead of being sent
+during the request. The ``hunger_send_outbox`` command drains the
+outbox with a pool of threads, retrying failed deliveries with
+exponential backoff.
+
+Queued emails are handed to ``HUNGER_EMAIL_INVITE_FUNCTION`` with
+``request=None`` and the ``invite_url`` computed at enqueue time.
+"""
+import uuid
+import logging
+import datetime
+import threading
+
+from django.db import connection
+from django.utils.six.moves import queue
+
+from hunger.email import get_invite_url
+from hunger.models import InvitationEmail
+from hunger.signals import get_invite_function, invitation_recipient
+from hunger.utils import now
+
+logger = logging.getLogger(__name__)
+
+
+def enqueue(email, code, request=None):
+    """Put one invitation email in the outbox."""
+    return InvitationEmail.objects.create(
+        email=email,
+        code=code or '',
+        invite_url=get_invite_url(code, request),
+        next_attempt=now(),
+    )
+
+
+def enqueue_invitations(invitations, request=None):
+    """Put emails for many Invitations in the outbox, in one INSERT."""
+    right_now = now()
+    items = []
+    for invitation in invitations:
+        email, code = invitation_recipient(invitation)
+        if email is None:
+            continue
+        items.append(InvitationEmail(
+            email=email,
+            code=code or '',
+            invite_url=get_invite_url(code, request),
+            next_attempt=right_now,
+        ))
+    InvitationEmail.objects.bulk_create(items)
+    return len(items)
+
+
+def claim_batch(batch_size, lease=300):
+    """
+    Claim up to ``batch_size`` due emails for this worker.
+
+    Claimed emails are pushed ``lease`` seconds into the future, so other
+    workers skip them, and come due again if this worker dies.
+    """
+    claim = uuid.uuid4().hex
+    right_now = now()
+    due = InvitationEmail.objects.filter(status=InvitationEmail.PENDING,
+                                         next_attempt__lte=right_now)
+    pks = list(due.order_by('next_attempt')
+                  .values_list('pk', flat=True)[:batch_size])
+    if not pks:
+        return []
+    due.filter(pk__in=pks).update(
+        claim=claim,
+        next_attempt=right_now + datetime.timedelta(seconds=lease))
+    return list(InvitationEmail.objects.filter(claim=claim))
+
+
+def deliver(items, threads=4):
+    """Send the emails from a pool of threads.
+
+    Returns a list of ``(item, error)`` pairs, ``error`` being None on
+    success.
+    """
+    func = get_invite_function()
+    work = queue.Queue()
+    results = queue.Queue()
+    for item in items:
+        work.put(item)
+
+    def worker():
+        try:
+            while True:
+                try:
+                    item = work.get_nowait()
+                except queue.Empty:
+                    return
+                try:
+                    func(item.email, item.code or None, request=None,
+                         invite_url=item.invite_url)
+                except Exception as e:
+                    logger.exception('Sending invitation to %s failed'
+                                     % item.email)
+                    results.put((item, e))
+                else:
+                    results.put((item, None))
+        finally:
+            connection.close()
+
+    pool = [threading.Thread(target=worker)
+            for i in range(max(1, min(threads, len(items))))]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+
+    return [results.get() for i in range(results.qsize())]
+
+
+def process_outbox(batch_size=100, threads=4, max_attempts=5, backoff=60):
+    """
+    Send one batch of due outbox emails and record the outcome.
+
+    Failed emails are retried after ``backoff * 2 ** attempts`` seconds
+    and given up on after ``max_attempts``. Returns ``(sent, failed)``,
+    or None when nothing was due.
+    """
+    items = claim_batch(batch_size)
+    if not items:
+        return None
+
+    sent = []
+    failed = 0
+    for item, error in deliver(items, threads):
+        if error is None:
+            sent.append(item.pk)
+            continue
+        failed += 1
+        item.attempts += 1
+        item.last_error = '%r' % error
+        item.claim = ''
+        if item.attempts >= max_attempts:
+            item.status = InvitationEmail.FAILED
+        else:
+            item.next_attempt = now() + datetime.timedelta(
+                seconds=backoff * 2 ** item.attempts)
+        item.save()
+
+    InvitationEmail.objects.filter(pk__in=sent).update(
+        status=InvitationEmail.SENT, sent=now(), claim='')
+    return len(sent), failed
@@ -1,47 +1,131 @@
 import logging
-import importlib
 
+from django.db.models import F
 from django.dispatch import Signal
-from hunger.utils import setting
+from hunger.metrics import timer
+from hunger.utils import setting, import_path
 
 logger = logging.getLogger(__name__)
 
 
+def invitation_recipient(invitation):
+    """Return the ``(email, code)`` an Invitation should be sent to.
+
+    ``email`` is None when the invitation cannot be sent.
+    """
+    email = invitation.email or (invitation.user and invitation.user.email)
+    if invitation.code:
+        code = invitation.code.code
+    else:
+        code = None
+
+    if not email:
+        logger.warn('invitation_code_sent called without email')
+        return None, code
+
+    # we can invite a user directly with no code
+    # but, if we have no code and no user,
+    # we eon't just open it to the email without a code.
+    if code is None and not invitation.user:
+        logger.warn('Invite with code+email or user')
+        return None, code
+
+    return email, code
+
+
+_invite_function = {}
+
+
+def get_invite_function():
+    """Return the function set in ``HUNGER_EMAIL_INVITE_FUNCTION``.
+
+    It is imported on first use and kept for as long as the setting
+    stays the same.
+    """
+    path = setting('HUNGER_EMAIL_INVITE_FUNCTION')
+    try:
+        return _invite_function[path]
+    except KeyError:
+        _invite_function.clear()
+        func = _invite_function[path] = import_path(path)
+        return func
+
+
 def invitation_code_sent(sender, invitation, **kwargs):
     """Send invitation code to user.
 
     Invitation could be InvitationCode or Invitation.
     """
+    with timer('hunger.invite_sent'):
+        dispatch_invitation(sender, invitation, **kwargs)
+
+
+def dispatch_invitation(sender, invitation, **kwargs):
     logger.info("Sending invitation code %s %s" % (sender, invitation))
 
     if sender.__name__ == 'Invitation':
-        email = invitation.email or invitation.user.email
-        if invitation.code:
-            code = invitation.code.code
-        else:
-            code = None
+        email, code = invitation_recipient(invitation)
+        if email is None:
+            return
 
     elif sender.__name__ == 'InvitationCode':
         email = kwargs.pop('email', None)
         code = invitation.code
 
-    if not email:
-        logger.warn('invitation_code_sent called without email')
-        return
+        if not email:
+            logger.warn('invitation_code_sent called without email')
+            return
 
-    # we can invite a user directly with no code
-    # but, if we have no code and no user,
-    # we eon't just open it to the email without a code.
-    if code is None and not invitation.user:
-        logger.warn('Invite with code+email or user')
+    if setting('HUNGER_EMAIL_QUEUE'):
+        from hunger.outbox import enqueue
+        enqueue(email, code, kwargs.get('request'))
         return
 
-    bits = setting('HUNGER_EMAIL_INVITE_FUNCTION').rsplit('.', 1)
-    module_name, func_name = bits
-    module = importlib.import_module(module_name)
-    func = getattr(module, func_name)
+    func = get_invite_function()
     func(email, code, **kwargs)
 
 
+def counted_code(invitation):
+    """The code whose ``num_invited`` counts this invitation, if any."""
+    if invitation.user_id is not None:
+        return invitation.code_id
+    return None
+
+
+def remember_counted_code(sender, instance, **kwargs):
+    if instance.pk is None:
+        instance._hunger_counted_code = None
+    else:
+        instance._hunger_counted_code = counted_code(instance)
+
+
+def move_invited_count(instance, new):
+    """Keep ``InvitationCode.num_invited`` in step with its invitations.
+
+    Counters are moved with F() expressions, so concurrent saves don't
+    lose updates.
+    """
+    from hunger.models import InvitationCode
+
+    old = getattr(instance, '_hunger_counted_code', None)
+    if old == new:
+        return
+    if old is not None:
+        InvitationCode.objects.filter(pk=old, num_invited__gt=0).update(
+            num_invited=F('num_invited') - 1)
+    if new is not None:
+        InvitationCode.objects.filter(pk=new).update(
+            num_invited=F('num_invited') + 1)
+    instance._hunger_counted_code = new
+
+
+def invitation_counted(sender, instance, **kwargs):
+    move_invited_count(instance, counted_code(instance))
+
+
+def invitation_uncounted(sender, instance, **kwargs):
+    move_invited_count(instance, None)
+
+
 invite_sent = Signal(providing_args=['invitation'])
 invite_sent.connect(invitation_code_sent)
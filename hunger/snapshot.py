@@ -0,0 +1,179 @@
+"""
+In-process snapshot of admitted users.
+
+With ``HUNGER_ADMITTED_SNAPSHOT`` enabled, every process keeps the ids
+of the users holding a used invitation in a sorted ``array('l')``, 8
+bytes per user on 64-bit platforms, and ``BetaMiddleware`` answers
+"is this user in beta" with a binary search instead of querying the
+user's invitations.
+
+The snapshot is built on first use and then refreshed incrementally,
+at most every ``HUNGER_SNAPSHOT_REFRESH`` seconds: only invitations
+used since the newest ``used`` seen so far, minus
+``HUNGER_SNAPSHOT_OVERLAP`` seconds for rows committed late, are read.
+Admissions that are taken back (an invitation deleted or its ``used``
+cleared) are only noticed by the full rebuild every
+``HUNGER_SNAPSHOT_REBUILD`` seconds.
+"""
+import bisect
+import datetime
+import threading
+from array import array
+from itertools import chain, groupby
+from timeit import default_timer
+
+from django.db.models import Max
+from django.test.signals import setting_changed
+
+from hunger.utils import setting, chunked_values
+
+# Python 2 has no 'q' typecode; 'l' is 64 bits on 64-bit Unix.
+TYPECODE = 'l'
+
+
+def merged(ids, new):
+    """Return a sorted array of ``ids`` and the sorted ``new`` ids.
+
+    The runs of ``ids`` between new ids are copied as slices, so the
+    cost is a few memory copies plus a binary search per new id.
+    """
+    result = array(TYPECODE)
+    start = 0
+    for user_id in new:
+        i = bisect.bisect_left(ids, user_id, start)
+        result.extend(ids[start:i])
+        result.append(user_id)
+        start = i
+    result.extend(ids[start:])
+    return result
+
+
+def admitted():
+    from hunger.models import Invitation
+    # exclude(user=None) tests the column, user__isnull=False would
+    # join the users table.
+    return Invitation.objects.filter(used__isnull=False).exclude(user=None)
+
+
+class AdmittedSnapshot(object):
+    """A sorted array of admitted user ids and the newest ``used`` seen."""
+
+    def __init__(self, refresh_every=30, rebuild_every=3600, overlap=60,
+                 chunk_size=10000):
+        self.ids = array(TYPECODE)
+        self.pending = set()
+        self.high_water = None
+        self.refresh_every = refresh_every
+        self.rebuild_every = rebuild_every
+        self.overlap = datetime.timedelta(seconds=overlap)
+        self.chunk_size = chunk_size
+        self.refreshed = self.rebuilt = None
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, user_id):
+        return user_id in self.pending or self._indexed(user_id)
+
+    def _indexed(self, user_id):
+        ids = self.ids
+        i = bisect.bisect_left(ids, user_id)
+        return i < len(ids) and ids[i] == user_id
+
+    @property
+    def nbytes(self):
+        return len(self.ids) * self.ids.itemsize
+
+    def _read(self, queryset, chunked=True):
+        """Return the sorted, unique user ids of ``queryset`` and the
+        newest ``used`` among them."""
+        # Taken first: rows used after it are read again next time.
+        high_water = queryset.aggregate(last=Max('used'))['last']
+        ids = array(TYPECODE)
+        if chunked:
+            for rows in chunked_values(queryset, ('user',), self.chunk_size):
+                ids.extend(row[0] for row in rows)
+        else:
+            ids.extend(queryset.values_list('user', flat=True))
+        ids = array(TYPECODE, (k for k, g in groupby(sorted(ids))))
+        return ids, high_water
+
+    def _merge(self, new):
+        """Merge the ``new`` ids and those added since into the array."""
+        # list() copies the set in one step, even while add() runs.
+        pending = list(self.pending)
+        missing = sorted(set(user_id for user_id in chain(new, pending)
+                             if not self._indexed(user_id)))
+        if missing:
+            self.ids = merged(self.ids, missing)
+        self.pending.difference_update(pending)
+
+    def rebuild(self):
+        self.ids, self.high_water = self._read(admitted())
+        self._merge(())
+        self.refreshed = self.rebuilt = default_timer()
+
+    def refresh(self):
+        """Add the users admitted since the last refresh."""
+        if self.high_water is None:
+            return self.rebuild()
+        # Few rows, read at once through the index on ``used``.
+        new, high_water = self._read(admitted().filter(
+            used__gte=self.high_water - self.overlap), chunked=False)
+        self._merge(new)
+        if high_water is not None and high_water > self.high_water:
+            self.high_water = high_water
+        self.refreshed = default_timer()
+
+    def add(self, user_id):
+        """Remember a user admitted by this process right away.
+
+        The id waits in a set until the next refresh merges it, so
+        admissions neither move the whole array nor race with a
+        refresh replacing it.
+        """
+        self.pending.add(user_id)
+
+    def maybe_refresh(self):
+        """Rebuild or refresh when due, unless another thread already is."""
+        now = default_timer()
+        rebuild = (self.rebuilt is None or
+                   now - self.rebuilt >= self.rebuild_every)
+        if not rebuild and now - self.refreshed < self.refresh_every:
+            return
+        if not self._lock.acquire(False):
+            return
+        try:
+            if rebuild:
+                self.rebuild()
+            else:
+                self.refresh()
+        finally:
+            self._lock.release()
+
+
+_snapshot = []
+
+
+def get_snapshot():
+    """Return this process' snapshot, or None when disabled."""
+    if not setting('HUNGER_ADMITTED_SNAPSHOT'):
+        return None
+    if not _snapshot:
+        _snapshot.append(AdmittedSnapshot(
+            refresh_every=setting('HUNGER_SNAPSHOT_REFRESH'),
+            rebuild_every=setting('HUNGER_SNAPSHOT_REBUILD'),
+            overlap=setting('HUNGER_SNAPSHOT_OVERLAP'),
+        ))
+    return _snapshot[0]
+
+
+def reset_snapshot(sender, **kwargs):
+    if kwargs['setting'] in ('HUNGER_ADMITTED_SNAPSHOT',
+                             'HUNGER_SNAPSHOT_REFRESH',
+                             'HUNGER_SNAPSHOT_REBUILD',
+                             'HUNGER_SNAPSHOT_OVERLAP'):
+        del _snapshot[:]
+
+setting_changed.connect(reset_snapshot)
@@ -0,0 +1,96 @@
+"""
+Per-user beta status cache.
+
+When ``HUNGER_BETA_CACHE`` names a cache (an alias from ``CACHES`` or
+anything else accepted by ``django.core.cache.get_cache``), admitted
+users are remembered by user id so that the middleware can skip the
+invitation queries for them, even on a brand new session. Entries are
+dropped whenever one of the user's invitations is saved or deleted.
+
+:func:`user_status` also caches users who are invited or waiting, for
+the ``hunger-status`` polling endpoint.
+"""
+from django.core.cache import get_cache
+from django.test.signals import setting_changed
+
+from hunger.utils import setting
+
+IN_BETA = 'in_beta'
+INVITED = 'invited'
+WAITING = 'waiting'
+
+_backend = {}
+
+
+def get_backend():
+    """Return the configured cache backend, or None when disabled."""
+    name = setting('HUNGER_BETA_CACHE')
+    if not name:
+        return None
+    try:
+        return _backend[name]
+    except KeyError:
+        _backend.clear()
+        backend = _backend[name] = get_cache(name)
+        return backend
+
+
+def cache_key(user_id):
+    return 'hunger:status:%s' % user_id
+
+
+def get_status(user_id):
+    """Return the cached status for the user, or None if unknown."""
+    backend = get_backend()
+    if backend is None or user_id is None:
+        return None
+    return backend.get(cache_key(user_id))
+
+
+def set_status(user_id, status=IN_BETA):
+    backend = get_backend()
+    if backend is None or user_id is None:
+        return
+    backend.set(cache_key(user_id), status,
+                setting('HUNGER_BETA_CACHE_TIMEOUT'))
+
+
+def user_status(user):
+    """
+    Return ``IN_BETA``, ``INVITED`` or ``WAITING`` for the user.
+
+    The answer is cached like admissions are, so repeated lookups cost
+    a cache read; without a cache it costs one query.
+    """
+    value = get_status(user.pk)
+    if value is not None:
+        return value
+    value = WAITING
+    for used, invited in user.invitation_set.values_list('used', 'invited'):
+        if used:
+            value = IN_BETA
+            break
+        if invited:
+            value = INVITED
+    set_status(user.pk, value)
+    return value
+
+
+def invalidate(*user_ids):
+    backend = get_backend()
+    if backend is None:
+        return
+    backend.delete_many([cache_key(user_id) for user_id in user_ids
+                         if user_id is not None])
+
+
+def invitation_changed(sender, instance, **kwargs):
+    """Drop the cached status when an invitation is saved or deleted."""
+    invalidate(instance.user_id)
+
+
+def reset_backend(sender, **kwargs):
+    if kwargs['setting'] == 'HUNGER_BETA_CACHE':
+        _backend.clear()
+
+setting_changed.connect(reset_backend)
@@ -0,0 +1,73 @@
+"""
+Signed, expiring beta admission tokens.
+
+With ``HUNGER_ADMISSION_TOKEN`` enabled, the middleware hands admitted
+users a token (cookie and response header) signed with ``SECRET_KEY``.
+Requests of the logged in user presenting a valid token for that user
+are let through without reading the session flag or querying
+invitations; loading the user is all they cost. Logging in or out drops
+the token cookie.
+
+Each token carries the ``token_version`` of the invitation that
+admitted the user. ``Invitation.revoke_tokens`` bumps that version and,
+when ``HUNGER_BETA_CACHE`` is configured, publishes it there so older
+tokens are refused right away. Without a cache, revoked tokens stay
+valid until they expire after ``HUNGER_ADMISSION_TOKEN_MAX_AGE``.
+"""
+from django.core import signing
+
+from hunger import status
+from hunger.utils import setting
+
+SALT = 'hunger.admission'
+
+
+def make_token(user_id, invitation_id, version):
+    return signing.dumps([user_id, invitation_id, version], salt=SALT)
+
+
+def token_user(token):
+    """Return the id of the user admitted by the token, or None."""
+    try:
+        user_id, invitation_id, version = signing.loads(
+            token, salt=SALT,
+            max_age=setting('HUNGER_ADMISSION_TOKEN_MAX_AGE'))
+    except (signing.BadSignature, ValueError, TypeError):
+        return None
+    backend = status.get_backend()
+    if backend is not None:
+        current = backend.get(revocation_key(invitation_id))
+        if current is not None and version < current:
+            return None
+    return user_id
+
+
+def check_token(token, user_id):
+    """Return True if the token admits the given user."""
+    return user_id is not None and token_user(token) == user_id
+
+
+def get_token(request):
+    """Return the admission token sent with the request, if any."""
+    header = setting('HUNGER_ADMISSION_TOKEN_HEADER')
+    meta_key = 'HTTP_%s' % header.upper().replace('-', '_')
+    return (request.COOKIES.get(setting('HUNGER_ADMISSION_TOKEN_COOKIE')) or
+            request.META.get(meta_key))
+
+
+def revocation_key(invitation_id):
+    return 'hunger:token:%s' % invitation_id
+
+
+def revoke(invitation_id, version):
+    """Refuse tokens of the invitation older than ``version``."""
+    backend = status.get_backend()
+    if backend is not None:
+        backend.set(revocation_key(invitation_id), version,
+                    setting('HUNGER_ADMISSION_TOKEN_MAX_AGE'))
+
+
+def forget_token(sender, request, **kwargs):
+    """Have the middleware drop the token cookie on login and logout."""
+    if request is not None:
+        request._hunger_forget_token = True
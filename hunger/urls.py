@@ -8,6 +8,7 @@ urlpatterns = patterns('',
     url(r'^invite/$', InviteView.as_view(), name='hunger-invite'),
     # url(r'^sent/$', ConfirmationView.as_view(), name='hunger-confirmation'),
     url(r'^not-in-beta/$', NotBetaView.as_view(), name='hunger-not-in-beta'),
+    url(r'^status/$', 'hunger.views.beta_status', name='hunger-status'),
     url(r'^verified/$', VerifiedView.as_view(), name='hunger-verified'),
     url(r'^invalid/(?P<code>\w+)/$', InvalidView.as_view(), name='hunger-invalid'),
 )
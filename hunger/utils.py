@@ -1,7 +1,11 @@
+import string
 import datetime
+import importlib
 from django.conf import settings
 from django.core.urlresolvers import reverse_lazy
 from django.contrib.auth.models import User
+from django.test.signals import setting_changed
+from django.utils.encoding import force_text
 
 
 DEFAULT_SETTINGS = {
@@ -9,17 +13,65 @@ DEFAULT_SETTINGS = {
     'HUNGER_ENABLE': True,
     'HUNGER_ALWAYS_ALLOW_VIEWS': [],
     'HUNGER_ALWAYS_ALLOW_MODULES': [],
+    'HUNGER_ALWAYS_ALLOW_PREFIXES': [],
     'HUNGER_REDIRECT': reverse_lazy('hunger-not-in-beta'),
     'HUNGER_VERIFIED_REDIRECT': reverse_lazy('hunger-verified'),
     'HUNGER_ALLOW_FLATPAGES': [],
     'HUNGER_EMAIL_TEMPLATES_DIR': 'hunger',
     'HUNGER_EMAIL_INVITE_FUNCTION': 'hunger.email.beta_invite',
+    'HUNGER_BETA_CACHE': None,
+    'HUNGER_BETA_CACHE_TIMEOUT': 60 * 60,
+    'HUNGER_ADMITTED_SNAPSHOT': False,
+    'HUNGER_SNAPSHOT_REFRESH': 30,
+    'HUNGER_SNAPSHOT_REBUILD': 60 * 60,
+    'HUNGER_SNAPSHOT_OVERLAP': 60,
+    'HUNGER_CODE_ALPHABET': string.ascii_letters,
+    'HUNGER_CODE_LENGTH': 16,
+    'HUNGER_CODE_TAG_LENGTH': 0,
+    'HUNGER_CODE_CACHE': None,
+    'HUNGER_CODE_CACHE_TIMEOUT': 60,
+    'HUNGER_CLAIM_INVITATIONS': False,
+    'HUNGER_STATUS_MAX_WAIT': 25,
+    'HUNGER_STATUS_POLL_INTERVAL': 1,
+    'HUNGER_ADMISSION_TOKEN': False,
+    'HUNGER_ADMISSION_TOKEN_COOKIE': 'hunger_admission',
+    'HUNGER_ADMISSION_TOKEN_HEADER': 'X-Hunger-Admission',
+    'HUNGER_ADMISSION_TOKEN_MAX_AGE': 60 * 60 * 24,
+    'HUNGER_EMAIL_QUEUE': False,
+    'HUNGER_METRICS_BACKEND': 'hunger.metrics.LocMemMetrics',
+    'HUNGER_METRICS_CACHE': 'default',
 }
 
 
+_setting_values = {}
+
+
 def setting(name):
-    """Return setting value for given name or default value."""
-    return getattr(settings, name, None) or DEFAULT_SETTINGS[name]
+    """Return setting value for given name or default value.
+
+    Values are looked up once and cached until a ``setting_changed``
+    signal (sent by ``override_settings``) clears them. Lazy defaults
+    such as ``HUNGER_REDIRECT`` stay lazy, since the urlconf they are
+    reversed against may differ between requests.
+    """
+    try:
+        return _setting_values[name]
+    except KeyError:
+        value = _setting_values[name] = (getattr(settings, name, None) or
+                                         DEFAULT_SETTINGS[name])
+        return value
+
+
+def clear_setting_values(sender, **kwargs):
+    _setting_values.clear()
+
+setting_changed.connect(clear_setting_values)
+
+
+def import_path(path):
+    """Import the object at a dotted path like ``'hunger.email.beta_invite'``."""
+    module_name, name = path.rsplit('.', 1)
+    return getattr(importlib.import_module(module_name), name)
 
 
 def now():
@@ -29,3 +81,45 @@ def now():
         return timezone.now()
     else:
         return datetime.datetime.now()
+
+
+def get_user_model():
+    """Backwards compatible get_user_model for Django < 1.5."""
+    try:
+        from django.contrib.auth import get_user_model
+    except ImportError:
+        return User
+    return get_user_model()
+
+
+def normalize_email(email):
+    """Return ``email`` stripped and lowercased, for matching emails."""
+    return force_text(email or '').strip().lower()
+
+
+def absolute_uri(location, request=None):
+    """Build an absolute URI, from the current Site when there is no
+    request (management commands, workers)."""
+    if request is not None:
+        return request.build_absolute_uri(location)
+    from django.contrib.sites.models import Site
+    return 'http://%s%s' % (Site.objects.get_current().domain, location)
+
+
+def chunked_values(queryset, fields, chunk_size=1000):
+    """
+    Yield lists of ``values_list(*fields)`` rows from ``queryset``.
+
+    Rows are fetched ``chunk_size`` at a time in primary key order,
+    each chunk starting after the last key of the previous one, so no
+    backend ever buffers the whole table and deep pages stay cheap.
+    """
+    queryset = queryset.order_by('pk')
+    last = None
+    while True:
+        page = queryset if last is None else queryset.filter(pk__gt=last)
+        rows = list(page.values_list('pk', *fields)[:chunk_size])
+        if not rows:
+            return
+        last = rows[-1][0]
+        yield [row[1:] for row in rows]
@@ -1,10 +1,19 @@
+import json
+import math
+import time
+import hashlib
 import logging
 
 from django.core.urlresolvers import reverse_lazy
+from django.http import (HttpResponse, HttpResponseForbidden,
+                         HttpResponseNotModified)
+from django.utils.cache import patch_cache_control
+from django.utils.http import parse_etags, quote_etag
 from django.views.generic.base import TemplateView
 from django.views.generic.edit import FormView
 from django.shortcuts import redirect
 
+from hunger import codes, status
 from hunger.models import InvitationCode, Invitation
 from hunger.forms import InviteSendForm
 from hunger.utils import setting, now
@@ -38,27 +47,67 @@ class NotBetaView(TemplateView):
     """
     Display a message to the user after the invite request is completed
     successfully.
+
+    Waiting users poll this page, so users known to be in beta are
+    recognised from the session or the beta status cache without
+    queries, the waitlist invitation is only created once and the page
+    carries an ETag, which turns unchanged polls into 304 responses.
+
+    The template gets the user's waitlist ``position``, or None.
     """
     template_name = 'hunger/not_in_beta.html'
+    position = None
 
     def dispatch(self, request, *args, **kwargs):
+        invitations = ()
         if request.user.is_authenticated():
             verified_redirect = redirect(setting("HUNGER_VERIFIED_REDIRECT"))
-            invitations = request.user.invitation_set.all()
-            if any(i.used or i.invited for i in invitations):
+            if (request.session.get('hunger_in_beta') or
+                    status.get_status(request.user.pk) == status.IN_BETA):
+                return verified_redirect
+
+            invitations = list(request.user.invitation_set.all())
+            if any(i.used for i in invitations):
+                status.set_status(request.user.pk)
+                return verified_redirect
+
+            elif any(i.invited for i in invitations):
                 return verified_redirect
 
             elif invite_from_cookie_and_email(request):
                 return verified_redirect
 
             elif not invitations:
-                invitation = Invitation(
-                    user=request.user,
-                    email=request.user.email
-                )
-                invitation.save()
-
-        return super(TemplateView, self).dispatch(request, *args, **kwargs)
+                invitation, created = Invitation.objects.get_or_create(
+                    user=request.user, code=None,
+                    defaults={'email': request.user.email})
+                invitations = [invitation]
+
+            positions = [i.position for i in invitations if i.position]
+            self.position = min(positions) if positions else None
+
+        etag = self.get_etag(request, invitations)
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if (request.method in ('GET', 'HEAD') and if_none_match and
+                etag in parse_etags(if_none_match)):
+            response = HttpResponseNotModified()
+        else:
+            response = super(TemplateView, self).dispatch(
+                request, *args, **kwargs)
+        response['ETag'] = quote_etag(etag)
+        return response
+
+    def get_context_data(self, **kwargs):
+        context = super(NotBetaView, self).get_context_data(**kwargs)
+        context['position'] = self.position
+        return context
+
+    def get_etag(self, request, invitations):
+        """Identify the page shown to this user while nothing changes."""
+        key = '%s:%s:%s:%s' % (
+            self.template_name, request.user.pk,
+            ','.join(str(i.pk) for i in invitations), self.position)
+        return hashlib.md5(key.encode('utf-8')).hexdigest()
 
 
 class VerifiedView(TemplateView):
@@ -78,7 +127,61 @@ class InvalidView(TemplateView):
 
 
 def verify_invite(request, code=None):
+    if code:
+        checked = codes.check_code(code)
+        if checked is None:
+            return redirect('hunger-invalid', code=code)
+        code = checked
     response = redirect(setting('HUNGER_VERIFIED_REDIRECT'))
     if code:
         response.set_cookie('hunger_code', code)
     return response
+
+
+def beta_status(request):
+    """
+    Tell a polling client whether the user is in beta, invited or waiting.
+
+    The answer comes from :func:`hunger.status.user_status` and carries
+    an ETag, so clients revalidate with ``If-None-Match``. With
+    ``?wait=<seconds>`` an unchanged answer is held back until the
+    status changes or the wait, capped by ``HUNGER_STATUS_MAX_WAIT``,
+    runs out, and only then answered with a 304.
+    """
+    if not request.user.is_authenticated():
+        return HttpResponseForbidden(json.dumps({'status': None}),
+                                     content_type='application/json')
+
+    if_none_match = parse_etags(request.META.get('HTTP_IF_NONE_MATCH', ''))
+    try:
+        wait = float(request.GET.get('wait', 0))
+    except ValueError:
+        wait = 0
+    if math.isnan(wait):
+        wait = 0
+    wait = max(0, min(wait, setting('HUNGER_STATUS_MAX_WAIT')))
+    deadline = time.time() + wait
+    while True:
+        if request.session.get('hunger_in_beta'):
+            value = status.IN_BETA
+        else:
+            value = status.user_status(request.user)
+        etag = hashlib.md5(('%s:%s' % (request.user.pk, value))
+                           .encode('utf-8')).hexdigest()
+        if etag not in if_none_match or time.time() >= deadline:
+            break
+        time.sleep(setting('HUNGER_STATUS_POLL_INTERVAL'))
+
+    if etag in if_none_match:
+        response = HttpResponseNotModified()
+    else:
+        response = HttpResponse(json.dumps({
+            'status': value,
+            'in_beta': value == status.IN_BETA,
+            'invited': value == status.INVITED,
+            'waiting': value == status.WAITING,
+        }), content_type='application/json')
+    response['ETag'] = quote_etag(etag)
+    patch_cache_control(response, private=True, max_age=0,
+                        must_revalidate=True)
+    return response
@@ -0,0 +1,99 @@
+"""
+Waitlist positions.
+
+Every waiting invitation, one neither invited nor used, carries a
+``position``. New invitations join at the end of the line and leave it
+once invited or used, so telling a user "you are #N in line" is one
+indexed lookup instead of a COUNT over the waitlist.
+
+Invitations leaving the line leave gaps behind them, so positions
+overstate until ``manage.py hunger_rebuild_waitlist`` renumbers the
+line; run it periodically, e.g. from cron.
+"""
+from django.db import connection
+from django.db.models import Max, Q
+
+from hunger.models import Invitation, atomic
+from hunger.utils import chunked_values
+
+
+def waiting():
+    """Invitations in line, neither invited nor used."""
+    return Invitation.objects.filter(invited__isnull=True, used__isnull=True)
+
+
+def next_in_line(count, order='created', chunk_size=500):
+    """
+    Yield the primary keys of the ``count`` first waiting invitations
+    by ``order`` (``'created'`` or ``'pk'``), a list per chunk.
+
+    Every chunk is read with a keyset condition on ``(order, pk)``
+    after the last row of the previous chunk, so late chunks cost as
+    much as the first one, whether or not the rows read before have
+    left the line in the meantime.
+    """
+    queryset = waiting().order_by(order, 'pk')
+    last = None
+    while count > 0:
+        page = queryset
+        if last is not None:
+            value, pk = last
+            page = page.filter(Q(**{'%s__gt' % order: value}) |
+                               Q(**{order: value, 'pk__gt': pk}))
+        rows = list(page.values_list(order, 'pk')[:min(chunk_size, count)])
+        if not rows:
+            return
+        last = rows[-1]
+        count -= len(rows)
+        yield [row[1] for row in rows]
+
+
+def next_position():
+    """The position at the end of the line."""
+    last = Invitation.objects.aggregate(last=Max('position'))['last']
+    return (last or 0) + 1
+
+
+def position(user):
+    """Return the user's place in line, or None when not waiting."""
+    positions = Invitation.objects.filter(
+        user=user, position__isnull=False,
+    ).order_by('position').values_list('position', flat=True)[:1]
+    return positions[0] if positions else None
+
+
+def rebuild(chunk_size=1000):
+    """
+    Renumber the waiting invitations 1 to N in the order they joined.
+
+    Only rows whose position changes are written, with one UPDATE per
+    chunk. Returns N.
+    """
+    Invitation.objects.filter(position__isnull=False).filter(
+        Q(invited__isnull=False) | Q(used__isnull=False)).update(
+        position=None)
+
+    qn = connection.ops.quote_name
+    opts = Invitation._meta
+    sql = ('UPDATE %s SET %s = CASE %s %%s END WHERE %s IN (%%s) '
+           'AND %s IS NULL AND %s IS NULL' % (
+               qn(opts.db_table), qn(opts.get_field('position').column),
+               qn(opts.pk.column), qn(opts.pk.column),
+               qn(opts.get_field('invited').column),
+               qn(opts.get_field('used').column)))
+    count = 0
+    for rows in chunked_values(waiting(), ('pk', 'position'), chunk_size):
+        changed = []
+        for pk, current in rows:
+            count += 1
+            if current != count:
+                changed.append((pk, count))
+        if not changed:
+            continue
+        # Primary keys and positions are integers, and inlining them
+        # keeps large chunks clear of the database's parameter limits.
+        with atomic():
+            connection.cursor().execute(sql % (
+                ' '.join('WHEN %d THEN %d' % pair for pair in changed),
+                ','.join('%d' % pk for pk, new in changed)))
+    return count
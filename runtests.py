@@ -25,6 +25,7 @@ if not settings.configured:
             'django.contrib.sessions',
             'django.contrib.sites',
             'django.contrib.contenttypes',
+            'django.contrib.flatpages',
             # 'south',
             'hunger',
             'tests',
@@ -69,11 +70,42 @@ def runtests(*test_args, **kwargs):
     failures = test_runner.run_tests(test_args)
     sys.exit(failures)
 
+
+def bench(output=None, iterations=1000, cases=None, snapshot_size=None):
+    """Run the benchmarks in tests/bench.py against the test database."""
+    test_runner = DjangoTestSuiteRunner(verbosity=0, interactive=False)
+    test_runner.setup_test_environment()
+    old_config = test_runner.setup_databases()
+    try:
+        from tests.bench import run
+        run(iterations=iterations, output=output, only=cases,
+            snapshot_size=snapshot_size)
+    finally:
+        test_runner.teardown_databases(old_config)
+        test_runner.teardown_test_environment()
+
 if __name__ == '__main__':
     parser = OptionParser()
     parser.add_option('--failfast', action='store_true', default=False,
         dest='failfast')
+    parser.add_option('--bench', action='store_true', default=False,
+        dest='bench', help='Run the benchmarks instead of the tests.')
+    parser.add_option('--bench-output', dest='bench_output',
+        help='Write benchmark results as JSON to this file.')
+    parser.add_option('--bench-iterations', type='int', default=1000,
+        dest='bench_iterations')
+    parser.add_option('--bench-case', action='append', dest='bench_cases',
+        help='Only run this benchmark case, may be repeated.')
+    parser.add_option('--bench-snapshot-size', type='int',
+        dest='bench_snapshot_size',
+        help='Admitted users in the snapshot cases (default 1000000).')
 
     (options, args) = parser.parse_args()
 
-    runtests(failfast=options.failfast, *args)
+    if options.bench:
+        bench(output=options.bench_output,
+              iterations=options.bench_iterations,
+              cases=options.bench_cases,
+              snapshot_size=options.bench_snapshot_size)
+    else:
+        runtests(failfast=options.failfast, *args)
@@ -0,0 +1,387 @@
+"""
+Benchmarks for hunger, run with ``python runtests.py --bench``.
+
+Every case drives one code path (mostly a ``BetaMiddleware.process_view``
+branch) against the SQLite test database and reports its latency, the
+objects it allocates and the queries it runs. ``--bench-output`` writes
+the results as JSON, to diff across versions.
+
+Requests are built with RequestFactory and carry a plain dict as
+session, so the numbers cover hunger's own work only.
+"""
+import gc
+import datetime
+import sys
+import json
+import platform
+from timeit import default_timer
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser, User
+from django.db import connection
+from django.db.models import F
+from django.test.client import RequestFactory
+from django.test.signals import setting_changed
+
+from hunger.email import render_invites
+from hunger.middleware import BetaMiddleware
+from hunger.models import Invitation, InvitationCode
+from hunger.utils import now
+from hunger import snapshot, waitlist
+
+from . import views, always_allow_views
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+CASES = []
+
+
+def case(name):
+    """Register a benchmark case.
+
+    The decorated function sets up the data it needs and returns a
+    ``(run, reset)`` pair: ``run`` is timed, ``reset`` (or None) puts
+    the state back before each run and is not timed. A ``run`` doing
+    several units of work sets ``run.items`` to their number, which is
+    reported as a rate per second, and a slow one caps its repetitions
+    with ``run.iterations``.
+    """
+    def register(func):
+        CASES.append((name, func))
+        return func
+    return register
+
+
+def middleware_call(user, view=views.invited_only, path='/invited-only/',
+                    session=None, cookies=None, middleware=None):
+    middleware = middleware or BetaMiddleware()
+    factory = RequestFactory()
+
+    def run():
+        request = factory.get(path)
+        request.user = user
+        request.session = dict(session or {})
+        request.COOKIES.update(cookies or {})
+        return middleware.process_view(request, view, (), {})
+    return run
+
+
+def make_user(name, **kwargs):
+    user = User.objects.create_user(name, '%s@example.com' % name, 'secret')
+    for key, value in kwargs.items():
+        setattr(user, key, value)
+    return user
+
+
+@case('flatpage')
+def flatpage():
+    from django.contrib.flatpages.models import FlatPage
+    page = FlatPage.objects.create(url='/about/', title='About',
+                                   content='About us')
+    page.sites.add(settings.SITE_ID)
+    middleware = BetaMiddleware()
+    middleware.allow_list.flatpages = frozenset(['/about/'])
+    return middleware_call(AnonymousUser(), path='/about/',
+                           middleware=middleware), None
+
+
+@case('prefix_fast_lane')
+def prefix_fast_lane():
+    middleware = BetaMiddleware()
+    middleware.allow_list.prefixes = ('/health', '/static/')
+    factory = RequestFactory()
+
+    def run():
+        request = factory.get('/static/app.css')
+        middleware.process_request(request)
+        return middleware.process_view(request, views.invited_only, (), {})
+    return run, None
+
+
+@case('whitelisted_module')
+def whitelisted_module():
+    return middleware_call(AnonymousUser(),
+                           view=always_allow_views.allowed), None
+
+
+@case('always_allow_view')
+def always_allow_view():
+    return middleware_call(AnonymousUser(), view=views.always_allow), None
+
+
+@case('anonymous_redirect')
+def anonymous_redirect():
+    return middleware_call(AnonymousUser()), None
+
+
+@case('staff')
+def staff():
+    return middleware_call(make_user('staff', is_staff=True)), None
+
+
+@case('session_hit')
+def session_hit():
+    return middleware_call(make_user('session'),
+                           session={'hunger_in_beta': True}), None
+
+
+@case('used_invitation')
+def used_invitation():
+    user = make_user('used')
+    Invitation.objects.create(user=user, invited=now(), used=now())
+    return middleware_call(user), None
+
+
+@case('invited_activation')
+def invited_activation():
+    user = make_user('invited')
+    Invitation.objects.create(user=user, invited=now())
+
+    def reset():
+        Invitation.objects.filter(user=user).update(used=None)
+    return middleware_call(user), reset
+
+
+@case('cookie_code')
+def cookie_code():
+    user = make_user('cookie')
+    code = InvitationCode.objects.create(code='benchcookie', num_invites=1)
+    invitation = Invitation.objects.create(code=code, email=user.email,
+                                           invited=now())
+
+    def reset():
+        Invitation.objects.filter(pk=invitation.pk).update(user=None,
+                                                           used=None)
+        InvitationCode.objects.filter(pk=code.pk).update(num_invites=1)
+    return middleware_call(user, cookies={'hunger_code': code.code}), reset
+
+
+@case('render_invites')
+def render_invites_batch():
+    code = InvitationCode.objects.create(code='benchrender', num_invites=100)
+    for i in range(100):
+        Invitation.objects.create(code=code, email='render%d@example.com' % i)
+    invitations = list(Invitation.objects.filter(code=code)
+                                         .select_related('code', 'user'))
+
+    def run():
+        return list(render_invites(invitations))
+    run.items = len(invitations)
+    return run, None
+
+
+@case('bogus_cookie_cached')
+def bogus_cookie_cached():
+    settings.HUNGER_CODE_CACHE = 'default'
+    setting_changed.send(sender=None, setting='HUNGER_CODE_CACHE',
+                         value='default')
+    user = make_user('bogus')
+    Invitation.objects.create(user=user, email=user.email)
+    return middleware_call(user, cookies={'hunger_code': 'bogus'}), None
+
+
+WAITLIST_SIZE = 100000
+
+
+def fill_waitlist(size):
+    """Put ``size`` synthetic invitations in line, once."""
+    have = waitlist.waiting().filter(email__endswith='@waitlist.invalid')
+    missing = size - have.count()
+    start = waitlist.next_position()
+    Invitation.objects.bulk_create([
+        Invitation(email='w%d@waitlist.invalid' % (start + i),
+                   position=start + i)
+        for i in range(missing)])
+
+
+@case('waitlist_position')
+def waitlist_position():
+    fill_waitlist(WAITLIST_SIZE)
+    user = make_user('waiting')
+    Invitation.objects.create(user=user, email=user.email)
+
+    def run():
+        return waitlist.position(user)
+    return run, None
+
+
+@case('waitlist_rebuild')
+def waitlist_rebuild():
+    fill_waitlist(WAITLIST_SIZE)
+
+    def run():
+        return waitlist.rebuild()
+
+    def reset():
+        # Shift the whole line so that every row needs renumbering.
+        Invitation.objects.filter(position__isnull=False).update(
+            position=F('position') + 1)
+    run.items = waitlist.waiting().count()
+    run.iterations = 3
+    return run, reset
+
+
+SNAPSHOT_SIZE = 1000000
+
+
+def fill_admitted(size):
+    """Admit ``size`` synthetic users, once.
+
+    Only the invitations are created, the user ids they point to do
+    not exist, which SQLite does not check.
+    """
+    have = snapshot.admitted().filter(email__endswith='@admitted.invalid')
+    start = have.count()
+    # Admitted a while ago, outside the window refreshes read again.
+    used = now() - datetime.timedelta(days=1)
+    for offset in range(start, size, 50000):
+        Invitation.objects.bulk_create([
+            Invitation(user_id=10 ** 7 + i,
+                       email='a%d@admitted.invalid' % i,
+                       invited=used, used=used)
+            for i in range(offset, min(size, offset + 50000))])
+
+
+def snapshot_extra(snap):
+    return lambda: {'snapshot_ids': len(snap),
+                    'snapshot_bytes': snap.nbytes}
+
+
+@case('snapshot_build')
+def snapshot_build():
+    fill_admitted(SNAPSHOT_SIZE)
+    snap = snapshot.AdmittedSnapshot()
+
+    def run():
+        snap.rebuild()
+    run.iterations = 3
+    run.items = SNAPSHOT_SIZE
+    run.extra = snapshot_extra(snap)
+    return run, None
+
+
+@case('snapshot_refresh')
+def snapshot_refresh():
+    fill_admitted(SNAPSHOT_SIZE)
+    snap = snapshot.AdmittedSnapshot()
+    snap.rebuild()
+    next_id = [2 * 10 ** 7]
+
+    def reset():
+        # A hundred admissions since the last refresh.
+        used = now()
+        Invitation.objects.bulk_create([
+            Invitation(user_id=next_id[0] + i, email='', invited=used,
+                       used=used)
+            for i in range(100)])
+        next_id[0] += 100
+
+    def run():
+        snap.refresh()
+    run.iterations = 20
+    run.extra = snapshot_extra(snap)
+    return run, reset
+
+
+@case('snapshot_hit')
+def snapshot_hit():
+    fill_admitted(SNAPSHOT_SIZE)
+    middleware = BetaMiddleware()
+    middleware.snapshot = snapshot.AdmittedSnapshot(refresh_every=10 ** 6,
+                                                    rebuild_every=10 ** 6)
+    middleware.snapshot.rebuild()
+    user = make_user('snapshot')
+    middleware.snapshot.add(user.pk)
+    return middleware_call(user, middleware=middleware), None
+
+
+def measure(run, reset, iterations):
+    """Time ``run`` and count its queries and allocations."""
+    iterations = min(iterations, getattr(run, 'iterations', iterations))
+    timings = []
+    for i in range(iterations):
+        if reset is not None:
+            reset()
+        start = default_timer()
+        run()
+        timings.append(default_timer() - start)
+
+    if reset is not None:
+        reset()
+    connection.use_debug_cursor = True
+    del connection.queries[:]
+    run()
+    queries = len(connection.queries)
+    connection.use_debug_cursor = None
+
+    if reset is not None:
+        reset()
+    gc.collect()
+    if tracemalloc is not None:
+        tracemalloc.start()
+        run()
+        allocations = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        allocation_unit = 'peak_bytes'
+    else:
+        gc.disable()
+        before = len(gc.get_objects())
+        result = run()
+        allocations = len(gc.get_objects()) - before
+        del result
+        gc.enable()
+        allocation_unit = 'retained_gc_objects'
+
+    timings.sort()
+    mean = sum(timings) / len(timings)
+    result = {
+        'iterations': iterations,
+        'mean_us': mean * 1e6,
+        'median_us': timings[len(timings) // 2] * 1e6,
+        'p95_us': timings[int(len(timings) * 0.95)] * 1e6,
+        'min_us': timings[0] * 1e6,
+        'per_second': getattr(run, 'items', 1) / mean if mean else 0,
+        'queries': queries,
+        'allocations': allocations,
+        'allocation_unit': allocation_unit,
+    }
+    if hasattr(run, 'extra'):
+        result.update(run.extra())
+    return result
+
+
+def run(iterations=1000, output=None, only=None, snapshot_size=None):
+    global SNAPSHOT_SIZE
+    if snapshot_size:
+        SNAPSHOT_SIZE = snapshot_size
+    settings.ROOT_URLCONF = 'tests.urls'
+    results = {
+        'python': platform.python_version(),
+        'django': django.get_version(),
+        'database': connection.vendor,
+        'cases': {},
+    }
+    sys.stdout.write('%-24s %10s %10s %10s %10s %8s %12s\n' % (
+        'case', 'mean us', 'median us', 'p95 us', 'per sec', 'queries',
+        'allocations'))
+    for name, setup in CASES:
+        if only and name not in only:
+            continue
+        run_case, reset = setup()
+        result = results['cases'][name] = measure(run_case, reset,
+                                                  iterations)
+        sys.stdout.write('%-24s %10.1f %10.1f %10.1f %10.0f %8d %12d\n' % (
+            name, result['mean_us'], result['median_us'], result['p95_us'],
+            result['per_second'], result['queries'], result['allocations']))
+        if hasattr(run_case, 'extra'):
+            sys.stdout.write('%24s %s\n' % ('', ', '.join(
+                '%s=%s' % item for item in sorted(run_case.extra().items()))))
+
+    if output:
+        with open(output, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+    return results
@@ -1,9 +1,39 @@
+import django
+import os
+import struct
+import datetime
+import gzip
+import json
+import zlib
+import tempfile
+import threading
+
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.core.management import call_command
+from django.core.management.base import CommandError
 from django.core.urlresolvers import reverse
-from django.contrib.auth.models import User
-from django.test import TestCase
-from hunger import forms
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.auth.signals import user_logged_out
+from django.db import connection
+from django.http import HttpResponse
+from django.test import TestCase, TransactionTestCase
+from django.utils import unittest
+from django.utils.six import StringIO
+from django.test.client import RequestFactory
+from django.test.utils import override_settings
+from hunger import (claims, codecache, codes, forms, metrics, snapshot,
+                    status, tokens, waitlist)
+from hunger import views as hunger_views
+from hunger.views import NotBetaView
+from hunger.admin import export_email, export_email_gzip
+from hunger import email as hunger_email
+from hunger.email import render_invites, send_invites
+from hunger.middleware import AllowList, BetaMiddleware
 from hunger.utils import setting, now
-from hunger.models import Invitation, InvitationCode
+from hunger.models import Invitation, InvitationCode, InvitationEmail
+from hunger.outbox import process_outbox
+from . import views, always_allow_views
 
 
 class BetaViewTests(TestCase):
@@ -58,6 +88,13 @@ class BetaViewTests(TestCase):
         response = self.client.get(reverse('always_allow_module'))
         self.assertEqual(response.status_code, 200)
 
+    @override_settings(HUNGER_ALWAYS_ALLOW_MODULES=['tests.always_*'])
+    def test_always_allow_module_pattern(self):
+        response = self.client.get(reverse('always_allow_module'))
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get(reverse('invited_only'))
+        self.assertRedirects(response, reverse(self.redirect))
+
     def test_garden_when_not_invited(self):
         response = self.client.get(reverse('invited_only'))
         self.assertRedirects(response, reverse(self.redirect))
@@ -93,3 +130,1252 @@ class BetaViewTests(TestCase):
         response = self.client.get(reverse('invited_only'))
         #import IPython; IPython.embed()
         self.assertEqual(response.status_code, 200)
+
+    @override_settings(HUNGER_CODE_TAG_LENGTH=4)
+    def test_verify_rejects_forged_code(self):
+        with self.assertNumQueries(0):
+            response = self.client.get(reverse("hunger-verify",
+                                               args=["foobar"]))
+        self.assertTrue(response['Location'].endswith(
+            reverse('hunger-invalid', kwargs={'code': 'foobar'})))
+        self.assertFalse('hunger_code' in response.cookies)
+
+
+@override_settings(HUNGER_BETA_CACHE='default')
+class BetaStatusCacheTests(TestCase):
+    urls = 'tests.urls'
+
+    def setUp(self):
+        status.get_backend().clear()
+        self.bob = User.objects.create_user(
+            'bob', 'bob@example.com', 'secret')
+        right_now = now()
+        self.invitation = Invitation(
+            user=self.bob, invited=right_now, used=right_now)
+        self.invitation.save()
+
+    def tearDown(self):
+        status.get_backend().clear()
+
+    def test_fresh_session_skips_invitation_queries(self):
+        self.client.login(username='bob', password='secret')
+        response = self.client.get(reverse('invited_only'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(status.get_status(self.bob.pk), status.IN_BETA)
+
+        self.client.logout()
+        self.client.login(username='bob', password='secret')
+        # Session and user lookups only.
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('invited_only'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_invalidated_on_save_and_delete(self):
+        status.set_status(self.bob.pk)
+        self.invitation.save()
+        self.assertEqual(status.get_status(self.bob.pk), None)
+
+        status.set_status(self.bob.pk)
+        self.invitation.delete()
+        self.assertEqual(status.get_status(self.bob.pk), None)
+
+    def test_disabled_by_default(self):
+        with self.settings(HUNGER_BETA_CACHE=None):
+            status.set_status(self.bob.pk)
+            self.assertEqual(status.get_status(self.bob.pk), None)
+
+
+@override_settings(HUNGER_ADMISSION_TOKEN=True)
+class AdmissionTokenTests(TestCase):
+    urls = 'tests.urls'
+
+    def setUp(self):
+        self.bob = User.objects.create_user(
+            'bob', 'bob@example.com', 'secret')
+        right_now = now()
+        self.invitation = Invitation(
+            user=self.bob, invited=right_now, used=right_now)
+        self.invitation.save()
+
+    def test_token_issued_and_accepted(self):
+        self.client.login(username='bob', password='secret')
+        response = self.client.get(reverse('invited_only'))
+        token = response['X-Hunger-Admission']
+        self.assertEqual(self.client.cookies['hunger_admission'].value, token)
+        self.assertTrue(tokens.check_token(token, self.bob.pk))
+        self.assertFalse(tokens.check_token(token, self.bob.pk + 1))
+        self.assertFalse(tokens.check_token(token + 'x', self.bob.pk))
+
+        # Without the session flag, only the user lookup remains.
+        session = self.client.session
+        del session['hunger_in_beta']
+        session.save()
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('invited_only'))
+        self.assertEqual(response.status_code, 200)
+
+    def test_token_needs_its_user(self):
+        token = tokens.make_token(self.bob.pk, self.invitation.pk, 0)
+        self.client.cookies['hunger_admission'] = token
+        response = self.client.get(reverse('invited_only'))
+        self.assertEqual(response.status_code, 302)
+        self.client.cookies.clear()
+        response = self.client.get(reverse('invited_only'),
+                                   HTTP_X_HUNGER_ADMISSION=token)
+        self.assertEqual(response.status_code, 302)
+        User.objects.create_user('eve', 'eve@example.com', 'secret')
+        self.client.login(username='eve', password='secret')
+        response = self.client.get(reverse('invited_only'),
+                                   HTTP_X_HUNGER_ADMISSION=token)
+        self.assertEqual(response.status_code, 302)
+
+    def test_logout_drops_token(self):
+        request = RequestFactory().get('/')
+        user_logged_out.send(sender=User, request=request, user=self.bob)
+        response = BetaMiddleware().process_response(request, HttpResponse())
+        self.assertEqual(response.cookies['hunger_admission']['max-age'], 0)
+
+    def test_header_token(self):
+        token = tokens.make_token(self.bob.pk, self.invitation.pk, 0)
+        request = RequestFactory().get(
+            '/', HTTP_X_HUNGER_ADMISSION=token)
+        self.assertEqual(tokens.get_token(request), token)
+
+    @override_settings(HUNGER_BETA_CACHE='default')
+    def test_revoke_tokens(self):
+        token = tokens.make_token(self.bob.pk, self.invitation.pk, 0)
+        self.assertTrue(tokens.check_token(token, self.bob.pk))
+        self.invitation.revoke_tokens()
+        self.assertEqual(self.invitation.token_version, 1)
+        self.assertFalse(tokens.check_token(token, self.bob.pk))
+        token = tokens.make_token(self.bob.pk, self.invitation.pk, 1)
+        self.assertTrue(tokens.check_token(token, self.bob.pk))
+        status.get_backend().clear()
+
+
+class SendInvitesTests(TestCase):
+    urls = 'tests.urls'
+
+    def setUp(self):
+        self.code = InvitationCode(num_invites=10, code='bulk')
+        self.code.save()
+        for i in range(3):
+            Invitation(code=self.code, email='user%d@example.com' % i).save()
+        # Has neither code nor user, so it can't be sent.
+        Invitation(email='nocode@example.com').save()
+
+    def test_send_invites(self):
+        sent, seconds = send_invites(Invitation.objects.all(), chunk_size=2)
+        self.assertEqual(sent, 3)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertEqual(
+            Invitation.objects.filter(invited__isnull=True).count(), 0)
+        self.assertTrue('/hunger/verify/bulk/' in mail.outbox[0].body)
+        self.assertEqual(mail.outbox[0].to, ['user0@example.com'])
+
+    @override_settings(EMAIL_BACKEND='tests.tests.FailingBackend')
+    def test_failed_send_keeps_waiting(self):
+        self.assertRaises(IOError, send_invites, Invitation.objects.all())
+        self.assertFalse(Invitation.objects.filter(invited__isnull=False))
+        self.assertEqual(waitlist.waiting().count(), 4)
+
+    @override_settings(
+        HUNGER_EMAIL_INVITE_FUNCTION='tests.tests.failing_invite')
+    def test_failed_invite_function_keeps_waiting(self):
+        self.assertRaises(IOError, send_invites, Invitation.objects.all())
+        self.assertEqual(waitlist.waiting().count(), 4)
+
+    def test_used_invitations_are_skipped(self):
+        Invitation.objects.filter(email='user0@example.com').update(
+            used=now())
+        sent, seconds = send_invites(Invitation.objects.all())
+        self.assertEqual(sent, 2)
+
+    def test_command(self):
+        out = StringIO()
+        call_command('hunger_send_invites', pending=True, stdout=out)
+        self.assertEqual(len(mail.outbox), 3)
+        self.assertTrue(out.getvalue().startswith('Sent 3 invitations'))
+        mail.outbox = []
+        invitation = Invitation.objects.get(email='user1@example.com')
+        call_command('hunger_send_invites', str(invitation.pk), stdout=out)
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_render_invites(self):
+        invitations = Invitation.objects.select_related('code', 'user')
+        messages = list(render_invites(invitations))
+        self.assertEqual(len(messages), 3)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(messages[2].to, ['user2@example.com'])
+        self.assertTrue('/hunger/verify/bulk/' in messages[2].body)
+        self.assertEqual(messages[0].alternatives[0][1], 'text/html')
+
+    def test_templates_are_compiled_once(self):
+        folder = hunger_email.get_templates_folder()
+        templates = hunger_email.get_invite_templates(folder)
+        self.assertTrue(hunger_email.get_invite_templates(folder) is templates)
+        with override_settings(TEMPLATE_DIRS=()):
+            self.assertFalse(folder in hunger_email._template_bundles)
+
+
+def failing_invite(email, code, **kwargs):
+    raise IOError('SMTP is down')
+
+
+class FailingBackend(BaseEmailBackend):
+    def send_messages(self, messages):
+        raise IOError('SMTP is down')
+
+
+@override_settings(HUNGER_EMAIL_QUEUE=True)
+class OutboxTests(TestCase):
+    urls = 'tests.urls'
+
+    def setUp(self):
+        self.code = InvitationCode(num_invites=10, code='queued')
+        self.code.save()
+        for i in range(5):
+            Invitation(code=self.code, email='user%d@example.com' % i).save()
+
+    def test_requests_only_enqueue(self):
+        invitation = Invitation.objects.get(email='user0@example.com')
+        invitation.invited = now()
+        invitation.save(send_email=True)
+        sent, seconds = send_invites(Invitation.objects.exclude(
+            pk=invitation.pk))
+        self.assertEqual(sent, 4)
+        self.assertEqual(len(mail.outbox), 0)
+        self.assertEqual(InvitationEmail.objects.filter(
+            status=InvitationEmail.PENDING).count(), 5)
+
+    def test_worker_sends_outbox(self):
+        send_invites(Invitation.objects.all())
+        out = StringIO()
+        call_command('hunger_send_outbox', threads=3, batch_size=2,
+                     stdout=out)
+        self.assertEqual(out.getvalue(), 'Sent 5 emails, 0 failed.\n')
+        self.assertEqual(len(mail.outbox), 5)
+        self.assertEqual(
+            sorted(m.to[0] for m in mail.outbox),
+            ['user%d@example.com' % i for i in range(5)])
+        self.assertTrue('/hunger/verify/queued/' in mail.outbox[0].body)
+        self.assertEqual(InvitationEmail.objects.filter(
+            status=InvitationEmail.SENT, sent__isnull=False).count(), 5)
+
+    @override_settings(
+        HUNGER_EMAIL_INVITE_FUNCTION='tests.tests.failing_invite')
+    def test_retry_with_backoff(self):
+        send_invites(Invitation.objects.filter(email='user0@example.com'))
+        self.assertEqual(process_outbox(max_attempts=2, backoff=0), (0, 1))
+        item = InvitationEmail.objects.get()
+        self.assertEqual(item.status, InvitationEmail.PENDING)
+        self.assertEqual(item.attempts, 1)
+        self.assertTrue('SMTP is down' in item.last_error)
+
+        self.assertEqual(process_outbox(max_attempts=2, backoff=0), (0, 1))
+        item = InvitationEmail.objects.get()
+        self.assertEqual(item.status, InvitationEmail.FAILED)
+        self.assertEqual(process_outbox(), None)
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.bob = User.objects.create_user(
+            'bob', 'bob@example.com', 'secret')
+        Invitation(user=self.bob, invited=now(), used=now()).save()
+        Invitation(email='dany@example.com').save()
+        Invitation().save()
+
+    def assertExport(self, content):
+        lines = content.splitlines()
+        self.assertEqual(lines[0], 'email,created,invited,used')
+        self.assertEqual(len(lines), 3)
+        self.assertTrue(lines[1].startswith('bob@example.com,'))
+        self.assertEqual(len(lines[1].split(',')[3]), 19)
+        self.assertTrue(lines[2].startswith('dany@example.com,'))
+        self.assertTrue(lines[2].endswith(',,'))
+
+    def test_admin_export(self):
+        with self.assertNumQueries(2):
+            response = export_email(None, None, Invitation.objects.all())
+            content = b''.join(response)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertExport(content)
+
+    def test_admin_export_gzip(self):
+        response = export_email_gzip(None, None, Invitation.objects.all())
+        content = b''.join(response)
+        self.assertExport(zlib.decompress(content, 16 + zlib.MAX_WBITS))
+
+    def test_command(self):
+        handle, path = tempfile.mkstemp()
+        os.close(handle)
+        try:
+            call_command('hunger_export', path, gzip=True, chunk_size=1)
+            with open(path, 'rb') as f:
+                self.assertExport(gzip.GzipFile(fileobj=f).read())
+        finally:
+            os.remove(path)
+
+
+class CodeGenerationTests(TestCase):
+
+    def test_random_codes(self):
+        generated = codes.random_codes(50, alphabet='ab', length=5)
+        self.assertEqual(len(generated), 50)
+        for code in generated:
+            self.assertEqual(len(code), 5)
+            self.assertEqual(set(code) - set('ab'), set())
+        self.assertEqual(len(InvitationCode().generate_invite_code()), 16)
+
+    def test_generate_codes(self):
+        out = StringIO()
+        call_command('hunger_generate_codes', count=1200, max_invites=3,
+                     batch_size=500, stdout=out)
+        self.assertTrue(out.getvalue().startswith('Created 1200 codes'))
+        self.assertEqual(InvitationCode.objects.filter(
+            max_invites=3, num_invites=3).count(), 1200)
+
+    def test_duplicates_are_skipped(self):
+        InvitationCode(code='taken').save()
+        random_codes = codes.random_codes
+        batches = iter([['taken', 'fresh', 'fresh'], ['other']])
+        codes.random_codes = lambda count: next(batches)
+        try:
+            created = list(codes.generate_codes(2))
+        finally:
+            codes.random_codes = random_codes
+        self.assertEqual(created, [['fresh'], ['other']])
+
+    @override_settings(HUNGER_CODE_ALPHABET=codes.CROCKFORD,
+                       HUNGER_CODE_LENGTH=10, HUNGER_CODE_TAG_LENGTH=4)
+    def test_tagged_codes(self):
+        code = InvitationCode.objects.create().code
+        self.assertEqual(len(code), 14)
+        self.assertEqual(codes.check_code(code), code)
+        sloppy = ('%s-%s' % (code[:7], code[7:])).lower()
+        self.assertEqual(codes.check_code(sloppy.replace('0', 'o')), code)
+        forged = code[:-1] + ('0' if code[-1] != '0' else '1')
+        self.assertEqual(codes.check_code(forged), None)
+        self.assertEqual(codes.check_code(code + '0'), None)
+        self.assertEqual(codes.check_code('U' + code[1:]), None)
+        for created in codes.generate_codes(3):
+            self.assertTrue(all(codes.check_code(c) for c in created))
+
+    def test_legacy_codes_pass(self):
+        self.assertEqual(codes.check_code('foobar'), 'foobar')
+        self.assertEqual(codes.check_code(''), None)
+
+
+class RedemptionTests(TestCase):
+
+    def setUp(self):
+        self.code = InvitationCode(code='once', num_invites=1)
+        self.code.save()
+
+    def test_accept_invite_takes_one_use(self):
+        alice = User.objects.create_user('alice', 'alice@example.com', 's')
+        bob = User.objects.create_user('bob', 'bob@example.com', 's')
+        first = Invitation(code=self.code, email=alice.email)
+        first.save()
+        second = Invitation(code=self.code, email=bob.email)
+        second.save()
+
+        self.assertTrue(first.accept_invite(alice))
+        self.assertFalse(second.accept_invite(bob))
+        self.assertEqual(
+            InvitationCode.objects.get(pk=self.code.pk).num_invites, 0)
+        self.assertTrue(Invitation.objects.get(pk=first.pk).used)
+        second = Invitation.objects.get(pk=second.pk)
+        self.assertEqual((second.user, second.used), (None, None))
+
+
+@unittest.skipIf(
+    connection.vendor == 'sqlite' and
+    connection.creation._get_test_db_name() == ':memory:',
+    'threads need a shared test database')
+class ConcurrentRedemptionTests(TransactionTestCase):
+
+    def test_concurrent_redemptions_never_oversubscribe(self):
+        code = InvitationCode(code='launch', num_invites=3)
+        code.save()
+        invitations = []
+        for i in range(12):
+            user = User.objects.create_user(
+                'user%d' % i, 'user%d@example.com' % i, 'secret')
+            invitation = Invitation(code=code, email=user.email)
+            invitation.save()
+            invitations.append((invitation, user))
+
+        results = []
+        start = threading.Event()
+
+        def redeem(invitation, user):
+            start.wait()
+            try:
+                results.append(invitation.accept_invite(user))
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=redeem, args=pair)
+                   for pair in invitations]
+        for thread in threads:
+            thread.start()
+        start.set()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(sorted(results), [False] * 9 + [True] * 3)
+        self.assertEqual(
+            InvitationCode.objects.get(pk=code.pk).num_invites, 0)
+        self.assertEqual(
+            Invitation.objects.filter(used__isnull=False).count(), 3)
+
+
+class InvitedCountTests(TestCase):
+
+    def setUp(self):
+        self.code = InvitationCode(code='counted', max_invites=5)
+        self.code.save()
+        self.alice = User.objects.create_user('alice', 'alice@example.com',
+                                              'secret')
+        self.bob = User.objects.create_user('bob', 'bob@example.com',
+                                            'secret')
+
+    def num_invited(self, code=None):
+        code = code or self.code
+        return InvitationCode.objects.get(pk=code.pk).num_invited
+
+    def test_counter_follows_invitations(self):
+        Invitation(code=self.code, user=self.alice).save()
+        self.assertEqual(self.num_invited(), 1)
+
+        invitation = Invitation(code=self.code, email=self.bob.email)
+        invitation.save()
+        self.assertEqual(self.num_invited(), 1)
+        invitation = Invitation.objects.get(pk=invitation.pk)
+        invitation.accept_invite(self.bob)
+        self.assertEqual(self.num_invited(), 2)
+
+        other = InvitationCode(code='other')
+        other.save()
+        invitation.code = other
+        invitation.save()
+        self.assertEqual(self.num_invited(), 1)
+        self.assertEqual(self.num_invited(other), 1)
+
+        Invitation.objects.get(pk=invitation.pk).delete()
+        self.assertEqual(self.num_invited(other), 0)
+
+    def test_remaining_invites_costs_no_query(self):
+        Invitation(code=self.code, user=self.alice).save()
+        code = InvitationCode.objects.get(pk=self.code.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(code.remaining_invites(), 4)
+
+    def test_recount(self):
+        Invitation(code=self.code, user=self.alice).save()
+        Invitation(code=self.code, user=self.bob).save()
+        InvitationCode.objects.update(num_invited=7)
+        out = StringIO()
+        call_command('hunger_recount', dry_run=True, stdout=out)
+        self.assertEqual(out.getvalue(), 'Found 1 drifted counters.\n')
+        self.assertEqual(self.num_invited(), 7)
+        call_command('hunger_recount', stdout=out)
+        self.assertEqual(self.num_invited(), 2)
+
+
+class MiddlewareQueryTests(TestCase):
+    """Queries issued by BetaMiddleware itself, branch by branch.
+
+    The session is a plain dict, so only hunger's own queries count.
+    """
+    urls = 'tests.urls'
+
+    def setUp(self):
+        self.middleware = BetaMiddleware()
+        self.user = User.objects.create_user(
+            'alice', 'alice@example.com', 'secret')
+
+    def process_view(self, user=None, view=views.invited_only, cookies=None,
+                     session=None):
+        request = RequestFactory().get('/invited-only/')
+        request.user = user or self.user
+        request.session = session if session is not None else {}
+        request.COOKIES.update(cookies or {})
+        response = self.middleware.process_view(request, view, (), {})
+        return request, response
+
+    def test_whitelisted_module(self):
+        with self.assertNumQueries(0):
+            request, response = self.process_view(
+                user=AnonymousUser(), view=always_allow_views.allowed)
+        self.assertEqual(response, None)
+
+    def test_always_allow_view(self):
+        with self.assertNumQueries(0):
+            request, response = self.process_view(
+                user=AnonymousUser(), view=views.always_allow)
+        self.assertEqual(response, None)
+
+    def test_anonymous_redirect(self):
+        with self.assertNumQueries(0):
+            request, response = self.process_view(user=AnonymousUser())
+        self.assertEqual(response.status_code, 302)
+
+    def test_staff(self):
+        self.user.is_staff = True
+        with self.assertNumQueries(0):
+            request, response = self.process_view()
+        self.assertEqual(response, None)
+
+    def test_session_hit(self):
+        with self.assertNumQueries(0):
+            request, response = self.process_view(
+                session={'hunger_in_beta': True})
+        self.assertEqual(response, None)
+
+    def test_used_invitation(self):
+        Invitation(user=self.user, invited=now(), used=now()).save()
+        with self.assertNumQueries(1):
+            request, response = self.process_view()
+        self.assertEqual(response, None)
+        self.assertTrue(request.session['hunger_in_beta'])
+
+    def test_invited_activation(self):
+        Invitation(user=self.user, invited=now()).save()
+        with self.assertNumQueries(3):
+            request, response = self.process_view()
+        self.assertEqual(response, None)
+        self.assertTrue(request.session['hunger_in_beta'])
+
+    def test_waitlist_enrolment(self):
+        # The invitations, the end of the waitlist and the INSERT.
+        with self.assertNumQueries(3):
+            request, response = self.process_view()
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Invitation.objects.filter(user=self.user).count(), 1)
+
+    def test_waiting(self):
+        Invitation(user=self.user, email=self.user.email).save()
+        with self.assertNumQueries(1):
+            request, response = self.process_view()
+        self.assertEqual(response.status_code, 302)
+
+    def test_cookie_code(self):
+        code = InvitationCode(code='cookie', num_invites=2)
+        code.save()
+        Invitation(code=code, email=self.user.email, invited=now()).save()
+        # Without update_fields, Django < 1.5 checks the row exists first.
+        with self.assertNumQueries(6 if django.VERSION >= (1, 5) else 7):
+            request, response = self.process_view(
+                cookies={'hunger_code': 'cookie'})
+        self.assertEqual(response, None)
+        self.assertTrue(request.session['hunger_in_beta'])
+
+    def test_invalid_cookie_code(self):
+        Invitation(user=self.user, email=self.user.email).save()
+        with self.assertNumQueries(2):
+            request, response = self.process_view(
+                cookies={'hunger_code': 'bogus'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(request._hunger_delete_cookie)
+
+    @override_settings(HUNGER_CODE_TAG_LENGTH=4)
+    def test_forged_cookie_code(self):
+        Invitation(user=self.user, email=self.user.email).save()
+        with self.assertNumQueries(1):
+            request, response = self.process_view(
+                cookies={'hunger_code': 'forged'})
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(request._hunger_delete_cookie)
+
+    @override_settings(HUNGER_CODE_CACHE='default')
+    def test_code_lookup_cache(self):
+        Invitation(user=self.user, email=self.user.email).save()
+        self.process_view(cookies={'hunger_code': 'bogus'})
+        # Only the user's invitations, the bogus code is known.
+        with self.assertNumQueries(1):
+            request, response = self.process_view(
+                cookies={'hunger_code': 'bogus'})
+        self.assertTrue(request._hunger_delete_cookie)
+
+        code = InvitationCode.objects.create(code='bogus', num_invites=1)
+        self.assertEqual(codecache.lookup('bogus'), code.pk)
+        with self.assertNumQueries(0):
+            self.assertEqual(codecache.lookup('bogus'), code.pk)
+
+        # Redeeming the last invite bypasses post_save; a stale entry
+        # still can't admit anybody and is dropped once it fails.
+        InvitationCode.objects.filter(pk=code.pk).update(num_invites=0)
+        Invitation(code=code, email=self.user.email).save()
+        request, response = self.process_view(
+            cookies={'hunger_code': 'bogus'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(codecache.lookup('bogus'), None)
+
+        code.num_invites = 1
+        code.save()
+        request, response = self.process_view(
+            cookies={'hunger_code': 'bogus'})
+        self.assertEqual(response, None)
+        codecache.forget('bogus')
+
+    @override_settings(HUNGER_CODE_CACHE='default',
+                       HUNGER_CODE_ALPHABET=codes.CROCKFORD)
+    def test_stale_normalized_code_is_forgotten(self):
+        code = InvitationCode.objects.create(code='ABC0', num_invites=1)
+        Invitation(code=code, email=self.user.email).save()
+        self.assertEqual(codecache.lookup('ABC0'), code.pk)
+        InvitationCode.objects.filter(pk=code.pk).update(num_invites=0)
+        request, response = self.process_view(
+            cookies={'hunger_code': 'abc-o'})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(codecache.lookup('ABC0'), None)
+        codecache.forget('ABC0')
+
+
+class MetricsTests(TestCase):
+    urls = 'tests.urls'
+
+    def setUp(self):
+        metrics.get_metrics().reset()
+
+    def test_middleware_branches(self):
+        self.client.get(reverse('always_allow'))
+        self.client.get(reverse('invited_only'))
+        self.client.get(reverse('invited_only'))
+        snapshot = metrics.get_metrics().snapshot()
+        self.assertEqual(snapshot['counters'], {
+            'hunger.middleware.whitelisted': 1,
+            'hunger.middleware.anonymous': 2,
+        })
+        timing = snapshot['timings']['hunger.middleware.anonymous']
+        self.assertEqual(timing['count'], 2)
+        self.assertTrue(timing['min'] <= timing['mean'] <= timing['max'])
+
+    def test_invite_dispatch_and_email(self):
+        code = InvitationCode(code='metered')
+        code.save()
+        invitation = Invitation(code=code, email='dany@example.com',
+                                invited=now())
+        invitation.save(send_email=True)
+        counters = metrics.get_metrics().snapshot()['counters']
+        self.assertEqual(counters['hunger.invite_sent'], 1)
+        self.assertEqual(counters['hunger.email.render'], 1)
+        self.assertEqual(counters['hunger.email.send'], 1)
+
+    @override_settings(HUNGER_METRICS_BACKEND='hunger.metrics.CacheMetrics')
+    def test_cache_backend(self):
+        backend = metrics.get_metrics()
+        backend.reset()
+        backend.incr('hunger.test', 2)
+        backend.incr('hunger.test')
+        backend.timing('hunger.test', 0.5)
+        backend.timing('hunger.test', 1.5)
+        snapshot = backend.snapshot()
+        self.assertEqual(snapshot['counters'], {'hunger.test': 3})
+        self.assertEqual(snapshot['timings']['hunger.test']['mean'], 1.0)
+        backend.reset()
+        self.assertEqual(backend.snapshot()['counters'], {})
+
+    def test_command(self):
+        metrics.get_metrics().incr('hunger.test')
+        out = StringIO()
+        call_command('hunger_metrics', reset=True, stdout=out)
+        self.assertEqual(json.loads(out.getvalue())['counters'],
+                         {'hunger.test': 1})
+        self.assertEqual(metrics.get_metrics().snapshot()['counters'], {})
+
+
+class SettingTests(TestCase):
+
+    def test_values_are_cached_until_changed(self):
+        from hunger import utils
+        self.assertEqual(setting('HUNGER_EMAIL_TEMPLATES_DIR'), 'hunger')
+        self.assertTrue('HUNGER_EMAIL_TEMPLATES_DIR' in utils._setting_values)
+        with self.settings(HUNGER_EMAIL_TEMPLATES_DIR='other'):
+            self.assertEqual(setting('HUNGER_EMAIL_TEMPLATES_DIR'), 'other')
+        self.assertEqual(setting('HUNGER_EMAIL_TEMPLATES_DIR'), 'hunger')
+
+    def test_invite_function_is_resolved_once(self):
+        from hunger.email import beta_invite
+        from hunger.signals import get_invite_function
+        self.assertTrue(get_invite_function() is beta_invite)
+        with self.settings(
+                HUNGER_EMAIL_INVITE_FUNCTION='tests.tests.failing_invite'):
+            self.assertTrue(get_invite_function() is failing_invite)
+        self.assertTrue(get_invite_function() is beta_invite)
+
+
+class NotBetaViewTests(TestCase):
+    urls = 'tests.urls'
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'alice', 'alice@example.com', 'secret')
+
+    def get(self, etag=None, session=None):
+        request = RequestFactory().get('/hunger/not-in-beta/')
+        request.user = self.user
+        request.session = session if session is not None else {}
+        if etag:
+            request.META['HTTP_IF_NONE_MATCH'] = etag
+        response = NotBetaView.as_view()(request)
+        if hasattr(response, 'render'):
+            response.render()
+        return response
+
+    def test_enrols_once(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue('#1 in line' in response.content)
+        self.get()
+        self.assertEqual(Invitation.objects.filter(user=self.user).count(), 1)
+
+    def test_conditional_get(self):
+        etag = self.get()['ETag']
+        with self.assertNumQueries(1):
+            response = self.get(etag=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.get(etag='"stale"').status_code, 200)
+
+    def test_session_flag_skips_queries(self):
+        with self.assertNumQueries(0):
+            response = self.get(session={'hunger_in_beta': True})
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(HUNGER_BETA_CACHE='default')
+    def test_used_invitation_primes_status(self):
+        Invitation.objects.create(user=self.user, email=self.user.email,
+                                  invited=now(), used=now())
+        self.assertEqual(self.get().status_code, 302)
+        self.assertEqual(status.get_status(self.user.pk), status.IN_BETA)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.get().status_code, 302)
+        status.invalidate(self.user.pk)
+
+
+class StatusEndpointTests(TestCase):
+    urls = 'tests.urls'
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'alice', 'alice@example.com', 'secret')
+        self.invitation = Invitation.objects.create(user=self.user,
+                                                    email=self.user.email)
+
+    def get(self, etag=None, wait=None, user=None):
+        data = {'wait': wait} if wait is not None else {}
+        request = RequestFactory().get(reverse('hunger-status'), data)
+        request.user = user or self.user
+        request.session = {}
+        if etag:
+            request.META['HTTP_IF_NONE_MATCH'] = etag
+        return hunger_views.beta_status(request)
+
+    def test_status(self):
+        response = self.get()
+        self.assertEqual(json.loads(response.content)['status'], 'waiting')
+        self.assertTrue('private' in response['Cache-Control'])
+        self.invitation.invited = now()
+        self.invitation.save()
+        data = json.loads(self.get().content)
+        self.assertEqual(data['status'], 'invited')
+        self.assertTrue(data['invited'])
+        self.assertEqual(self.get(user=AnonymousUser()).status_code, 403)
+
+    @override_settings(HUNGER_BETA_CACHE='default')
+    def test_cached_revalidation(self):
+        etag = self.get()['ETag']
+        with self.assertNumQueries(0):
+            response = self.get(etag=etag)
+        self.assertEqual(response.status_code, 304)
+        send_invites(Invitation.objects.all())
+        response = self.get(etag=etag)
+        self.assertEqual(json.loads(response.content)['status'], 'invited')
+        status.invalidate(self.user.pk)
+
+    def test_long_poll(self):
+        etag = self.get()['ETag']
+        sleep = hunger_views.time.sleep
+
+        def admit(seconds):
+            Invitation.objects.filter(pk=self.invitation.pk).update(
+                used=now())
+        hunger_views.time.sleep = admit
+        try:
+            response = self.get(etag=etag, wait=10)
+        finally:
+            hunger_views.time.sleep = sleep
+        self.assertEqual(json.loads(response.content)['status'], 'in_beta')
+
+        with self.settings(HUNGER_STATUS_POLL_INTERVAL=0.01):
+            etag = response['ETag']
+            self.assertEqual(self.get(etag=etag, wait=0.05).status_code, 304)
+
+    def test_bad_wait(self):
+        etag = self.get()['ETag']
+        sleep = hunger_views.time.sleep
+
+        def fail(seconds):
+            self.fail('slept for a wait of nothing')
+        hunger_views.time.sleep = fail
+        try:
+            for wait in ('nan', '-inf', '-5', 'soon'):
+                self.assertEqual(self.get(etag=etag, wait=wait).status_code,
+                                 304)
+        finally:
+            hunger_views.time.sleep = sleep
+
+
+class WaitlistTests(TestCase):
+
+    def setUp(self):
+        self.users = [User.objects.create_user('user%d' % i,
+                                               'user%d@example.com' % i)
+                      for i in range(5)]
+        for user in self.users:
+            Invitation.objects.create(user=user, email=user.email)
+
+    def positions(self):
+        return list(waitlist.waiting().order_by('pk')
+                                      .values_list('position', flat=True))
+
+    def test_joining_and_leaving(self):
+        self.assertEqual(self.positions(), [1, 2, 3, 4, 5])
+        with self.assertNumQueries(1):
+            self.assertEqual(waitlist.position(self.users[3]), 4)
+        invitation = Invitation.objects.get(user=self.users[1])
+        invitation.invited = now()
+        invitation.save()
+        self.assertEqual(waitlist.position(self.users[1]), None)
+        send_invites(Invitation.objects.filter(user=self.users[2]))
+        self.assertEqual(waitlist.position(self.users[2]), None)
+        Invitation.objects.create(email='late@example.com')
+        self.assertEqual(self.positions(), [1, 4, 5, 6])
+
+    def test_rebuild(self):
+        Invitation.objects.filter(user__in=self.users[:2]).update(
+            invited=now())
+        Invitation.objects.bulk_create([Invitation(email='bulk@example.com')])
+        out = StringIO()
+        call_command('hunger_rebuild_waitlist', chunk_size=2, stdout=out)
+        self.assertTrue(out.getvalue().startswith('Ranked 4 waiting'))
+        self.assertEqual(self.positions(), [1, 2, 3, 4])
+        self.assertEqual(waitlist.position(self.users[2]), 1)
+        self.assertFalse(Invitation.objects.filter(
+            invited__isnull=False, position__isnull=False).exists())
+        # Nothing to renumber: clearing left rows and reading the line.
+        with self.assertNumQueries(3):
+            self.assertEqual(waitlist.rebuild(), 4)
+
+
+class AdmitCommandTests(TestCase):
+    urls = 'tests.urls'
+
+    def setUp(self):
+        code = InvitationCode.objects.create(code='admit', num_invites=10)
+        for i in range(5):
+            Invitation.objects.create(code=code,
+                                      email='user%d@example.com' % i)
+        # Make the last ones the oldest.
+        for i, invitation in enumerate(Invitation.objects.order_by('-pk')):
+            Invitation.objects.filter(pk=invitation.pk).update(
+                created=datetime.datetime(2013, 1, 1 + i))
+
+    def invited(self):
+        return sorted(Invitation.objects.filter(invited__isnull=False)
+                                        .values_list('email', flat=True))
+
+    def test_admit_oldest(self):
+        out = StringIO()
+        call_command('hunger_admit', next=3, chunk_size=2, stdout=out)
+        self.assertTrue(out.getvalue().startswith('Admitted 3 invitations'))
+        self.assertEqual(self.invited(), ['user2@example.com',
+                                          'user3@example.com',
+                                          'user4@example.com'])
+        self.assertEqual(len(mail.outbox), 3)
+        call_command('hunger_admit', next=10, order='pk', stdout=out)
+        self.assertEqual(len(self.invited()), 5)
+
+    def test_dry_run(self):
+        out = StringIO()
+        call_command('hunger_admit', next=2, dry_run=True, verbosity=2,
+                     stdout=out)
+        self.assertEqual(out.getvalue().splitlines()[-1],
+                         'Would admit 2 invitations.')
+        self.assertTrue('user4@example.com' in out.getvalue())
+        self.assertEqual(self.invited(), [])
+        self.assertEqual(len(mail.outbox), 0)
+
+    def test_rate_limit(self):
+        from hunger.management.commands import hunger_admit
+        pauses = []
+        sleep = hunger_admit.time.sleep
+        hunger_admit.time.sleep = pauses.append
+        try:
+            call_command('hunger_admit', next=5, rate=2, stdout=StringIO())
+        finally:
+            hunger_admit.time.sleep = sleep
+        self.assertEqual(len(mail.outbox), 5)
+        # Batches of two emails, each followed by up to a second's pause.
+        self.assertEqual(len(pauses), 3)
+        self.assertTrue(all(0 < pause <= 1 for pause in pauses))
+
+
+class ImportTests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_user('bob', 'bob@example.com')
+        Invitation.objects.create(email='old@example.com')
+
+    def import_file(self, suffix, content, **options):
+        f = tempfile.NamedTemporaryFile(suffix=suffix, delete=False)
+        try:
+            f.write(content)
+            f.close()
+            out = StringIO()
+            call_command('hunger_import', f.name, stdout=out, **options)
+        finally:
+            os.unlink(f.name)
+        return out.getvalue()
+
+    def test_csv(self):
+        out = self.import_file('.csv', (
+            'name,email\n'
+            'Bob,Bob@Example.com\n'
+            'Ann, ann@example.com \n'
+            'Ann again,ANN@example.com\n'
+            'Old,old@example.com\n'
+            'Nobody,not-an-email\n'
+            'Cy,cy@example.com\n'), batch_size=2)
+        self.assertTrue(out.startswith('Imported 3 of 6 rows'))
+        self.assertTrue('2 duplicates and 1 invalid' in out)
+        invitation = Invitation.objects.get(email='bob@example.com')
+        self.assertEqual(invitation.user, self.user)
+        self.assertEqual(
+            list(waitlist.waiting().order_by('pk')
+                                   .values_list('email', 'position')),
+            [('old@example.com', 1), ('bob@example.com', 2),
+             ('ann@example.com', 3), ('cy@example.com', 4)])
+
+    def test_jsonl(self):
+        content = ('{"email": "ann@example.com"}\n'
+                   '"cy@example.com"\n'
+                   '\n'
+                   '{"name": "nobody"}\n'
+                   'not json\n')
+        out = self.import_file('.jsonl', content)
+        self.assertTrue(out.startswith('Imported 2 of 4 rows'))
+        self.assertTrue('Peak memory' in out)
+        # A second import finds everything there already.
+        out = self.import_file('.json', content)
+        self.assertTrue(out.startswith('Imported 0 of 4 rows'))
+
+    def test_enrolled_users_are_skipped(self):
+        Invitation.objects.create(user=self.user, email='')
+        self.import_file('.csv', 'bob@example.com\n')
+        self.assertFalse(
+            Invitation.objects.filter(email='bob@example.com').exists())
+
+    def test_mixed_case_rows_are_matched(self):
+        Invitation.objects.create(email='Ann@Example.com')
+        cy = User.objects.create_user('cy', 'Cy@Example.com')
+        out = self.import_file('.csv', 'Ann@Example.com\nCy@example.com\n')
+        self.assertTrue(out.startswith('Imported 1 of 2 rows'))
+        self.assertFalse(
+            Invitation.objects.filter(email='ann@example.com').exists())
+        self.assertEqual(Invitation.objects.get(user=cy).email,
+                         'cy@example.com')
+
+
+class PrefixFastLaneTests(TestCase):
+    urls = 'tests.urls'
+
+    @override_settings(HUNGER_ALWAYS_ALLOW_PREFIXES=['/static/', '/health',
+                                                     '/static/img/'])
+    def test_prefixes(self):
+        middleware = BetaMiddleware()
+        self.assertEqual(middleware.allow_list.prefixes,
+                         ('/health', '/static/'))
+        request = RequestFactory().get('/static/app.css')
+        # Neither the user nor the session may be touched.
+        self.assertEqual(middleware.process_request(request), None)
+        with self.assertNumQueries(0):
+            response = middleware.process_view(request, views.invited_only,
+                                               (), {})
+        self.assertEqual(response, None)
+
+        request = RequestFactory().get('/invited-only/')
+        request.user = AnonymousUser()
+        middleware.process_request(request)
+        response = middleware.process_view(request, views.invited_only,
+                                           (), {})
+        self.assertEqual(response.status_code, 302)
+
+
+class SnapshotTests(TestCase):
+    urls = 'tests.urls'
+
+    def setUp(self):
+        User.objects.bulk_create([User(username='user%d' % i)
+                                  for i in range(80)])
+        self.users = list(User.objects.order_by('pk'))
+
+    def admit(self, users, used=None):
+        Invitation.objects.bulk_create([
+            Invitation(user=user, email='', invited=now(),
+                       used=used or now())
+            for user in users])
+
+    def test_build_and_refresh(self):
+        self.admit(self.users[:3])
+        Invitation.objects.create(user=self.users[3], email='')
+        snap = snapshot.AdmittedSnapshot(chunk_size=2)
+        snap.rebuild()
+        self.assertEqual(list(snap.ids), [u.pk for u in self.users[:3]])
+        self.assertFalse(self.users[3].pk in snap)
+        self.assertEqual(snap.nbytes, 3 * snap.ids.itemsize)
+
+        # Committed late, but within the overlap.
+        self.admit([self.users[3]],
+                   used=snap.high_water - datetime.timedelta(seconds=10))
+        snap.refresh()
+        self.assertTrue(self.users[3].pk in snap)
+        self.admit(self.users[4:])
+        snap.refresh()
+        self.assertEqual(list(snap.ids), [u.pk for u in self.users])
+
+    def test_add(self):
+        pks = [u.pk for u in self.users]
+        self.admit(self.users[:2])
+        snap = snapshot.AdmittedSnapshot()
+        snap.rebuild()
+        snap.add(pks[5])
+        snap.add(pks[3])
+        self.assertTrue(pks[5] in snap)
+        self.assertEqual(len(snap.ids), 2)
+        snap.refresh()
+        self.assertEqual(list(snap.ids), [pks[0], pks[1], pks[3], pks[5]])
+        self.assertEqual(snap.pending, set())
+
+    @override_settings(HUNGER_ADMITTED_SNAPSHOT=True)
+    def test_middleware(self):
+        self.admit(self.users[:1])
+        middleware = BetaMiddleware()
+        request = RequestFactory().get('/invited-only/')
+        request.user = self.users[0]
+        request.session = {}
+        middleware.process_view(request, views.invited_only, (), {})
+        with self.assertNumQueries(0):
+            response = middleware.process_view(request, views.invited_only,
+                                               (), {})
+        self.assertEqual(response, None)
+
+        # Users admitted by the process are added at once.
+        user = self.users[1]
+        Invitation.objects.create(user=user, email='', invited=now())
+        request.user = user
+        middleware.process_view(request, views.invited_only, (), {})
+        self.assertTrue(user.pk in snapshot.get_snapshot())
+
+
+class AdmittedExportTests(TestCase):
+
+    def setUp(self):
+        self.users = [User.objects.create_user('user%d' % i,
+                                               'user%d@example.com' % i)
+                      for i in range(4)]
+        for user in reversed(self.users[:3]):
+            Invitation.objects.create(user=user, email='', invited=now(),
+                                      used=now())
+        # A second used invitation, and a waiting user.
+        code = InvitationCode.objects.create(code='again')
+        Invitation.objects.create(user=self.users[0], code=code,
+                                  invited=now(), used=now())
+        Invitation.objects.create(user=self.users[3], email='')
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, 'admitted')
+
+    def tearDown(self):
+        for name in os.listdir(self.dir):
+            os.unlink(os.path.join(self.dir, name))
+        os.rmdir(self.dir)
+
+    def export(self, **options):
+        out = StringIO()
+        call_command('hunger_export_admitted', self.path, chunk_size=2,
+                     stdout=out, **options)
+        with open(self.path, 'rb') as f:
+            return out.getvalue(), f.read()
+
+    def test_text(self):
+        out, data = self.export()
+        self.assertEqual(out, 'Wrote 3 admitted users to the allowlist '
+                              '%s.\n' % self.path)
+        self.assertEqual(data, ''.join(
+            '%d %s\n' % (u.pk, u.email) for u in self.users[:3]))
+        self.assertEqual(sorted(os.listdir(self.dir)),
+                         ['admitted', 'admitted.since'])
+
+    def test_binary(self):
+        out, data = self.export(format='binary')
+        self.assertEqual(data[:8], b'HUNGERA1')
+        self.assertEqual(list(struct.unpack('<3q', data[8:])),
+                         [u.pk for u in self.users[:3]])
+
+    def test_delta(self):
+        Invitation.objects.filter(used__isnull=False).update(
+            used=now() - datetime.timedelta(days=3))
+        Invitation.objects.filter(user=self.users[2]).update(
+            used=now() - datetime.timedelta(days=1))
+        # Django < 1.5 exits on a CommandError from call_command.
+        self.assertRaises((CommandError, SystemExit), self.export,
+                          delta=True)
+        out, full = self.export()
+        Invitation.objects.filter(user=self.users[3]).update(
+            invited=now(), used=now())
+        with self.settings(HUNGER_SNAPSHOT_OVERLAP=60):
+            out, data = self.export(delta=True)
+        self.assertEqual(out, 'Wrote 2 admitted users to the delta '
+                              '%s.delta.\n' % self.path)
+        # The edge keeps the full allowlist, and gets the new users from
+        # the delta, along with the rows at the high-water mark.
+        self.assertEqual(data, full)
+        with open(self.path + '.delta', 'rb') as f:
+            self.assertEqual(f.read(), '%d user2@example.com\n'
+                                       '%d user3@example.com\n'
+                             % (self.users[2].pk, self.users[3].pk))
+
+        # A full export takes the new users in and empties the delta.
+        out, full = self.export()
+        self.assertTrue('%d user3@example.com\n' % self.users[3].pk in full)
+        with open(self.path + '.delta', 'rb') as f:
+            self.assertEqual(f.read(), '')
+
+
+@override_settings(HUNGER_CLAIM_INVITATIONS=True)
+class ClaimTests(TestCase):
+    urls = 'tests.urls'
+
+    def setUp(self):
+        self.code = InvitationCode.objects.create(code='CLAIM', num_invites=1)
+
+    def test_signup_redeems_code_invitation(self):
+        invitation = Invitation.objects.create(
+            email='ann@example.com', code=self.code, invited=now())
+        user = User.objects.create_user('ann', 'Ann@Example.com', 'secret')
+        invitation = Invitation.objects.get(pk=invitation.pk)
+        self.assertEqual(invitation.user, user)
+        self.assertTrue(invitation.used)
+        code = InvitationCode.objects.get(pk=self.code.pk)
+        self.assertEqual((code.num_invites, code.num_invited), (0, 1))
+        self.assertEqual(status.user_status(user), status.IN_BETA)
+
+    def test_exhausted_code_is_not_claimed(self):
+        InvitationCode.objects.filter(pk=self.code.pk).update(num_invites=0)
+        invitation = Invitation.objects.create(
+            email='ann@example.com', code=self.code, invited=now())
+        user = User.objects.create_user('ann', 'ann@example.com', 'secret')
+        self.assertFalse(user.invitation_set.exists())
+        self.assertEqual(Invitation.objects.get(pk=invitation.pk).invited,
+                         invitation.invited)
+
+    def test_login_claims_waitlist_and_invited_rows(self):
+        user = User.objects.create_user('bob', 'bob@example.com', 'secret')
+        Invitation.objects.create(email='bob@example.com')
+        Invitation.objects.create(email='bob@example.com', invited=now())
+        Invitation.objects.create(email='other@example.com')
+        self.client.login(username='bob', password='secret')
+        self.assertEqual(user.invitation_set.count(), 2)
+        response = self.client.get(reverse('invited_only'))
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(user.invitation_set.filter(used__isnull=False))
+
+    def test_claim_queries(self):
+        user = User.objects.create_user('bob', 'bob@example.com', 'secret')
+        Invitation.objects.create(email='bob@example.com', code=self.code,
+                                  invited=now())
+        Invitation.objects.create(email='bob@example.com', code=self.code)
+        with self.assertNumQueries(3):
+            self.assertEqual(claims.claim_invitations(user), 1)
+        with self.assertNumQueries(1):
+            self.assertEqual(claims.claim_invitations(user), 0)
+
+    def test_held_code_is_skipped(self):
+        user = User.objects.create_user('bob', 'bob@example.com', 'secret')
+        Invitation.objects.create(user=user, email='bob@example.com',
+                                  code=self.code, used=now())
+        duplicate = Invitation.objects.create(email='bob@example.com',
+                                              code=self.code)
+        waiting = Invitation.objects.create(email='bob@example.com')
+        self.assertEqual(claims.claim_invitations(user), 1)
+        self.assertEqual(Invitation.objects.get(pk=waiting.pk).user, user)
+        self.assertEqual(Invitation.objects.get(pk=duplicate.pk).user, None)
+
+    def test_claimed_meanwhile(self):
+        user = User.objects.create_user('bob', 'bob@example.com', 'secret')
+        other = User.objects.create_user('cy', 'cy@example.com', 'secret')
+        invitation = Invitation.objects.create(
+            email='bob@example.com', code=self.code, invited=now())
+        right_now = claims.now
+
+        def claim_first():
+            Invitation.objects.filter(pk=invitation.pk).update(user=other)
+            return right_now()
+        claims.now = claim_first
+        try:
+            self.assertEqual(claims.claim_invitations(user), 0)
+        finally:
+            claims.now = right_now
+        code = InvitationCode.objects.get(pk=self.code.pk)
+        self.assertEqual((code.num_invites, code.num_invited), (1, 0))
+        self.assertEqual(status.user_status(user), status.WAITING)
+
+    def test_unsent_code_invitation_is_not_redeemed(self):
+        Invitation.objects.create(email='ann@example.com', code=self.code)
+        user = User.objects.create_user('ann', 'ann@example.com', 'secret')
+        self.assertFalse(user.invitation_set.exists())
+        self.assertEqual(
+            InvitationCode.objects.get(pk=self.code.pk).num_invites, 1)
+
+    def test_inactive_signup(self):
+        Invitation.objects.create(email='ann@example.com', code=self.code,
+                                  invited=now())
+        user = User(username='ann', email='ann@example.com',
+                    is_active=False)
+        user.save()
+        self.assertFalse(user.invitation_set.exists())
+
+    @override_settings(HUNGER_CLAIM_INVITATIONS=False)
+    def test_disabled(self):
+        Invitation.objects.create(email='ann@example.com', code=self.code)
+        user = User.objects.create_user('ann', 'ann@example.com', 'secret')
+        self.assertFalse(user.invitation_set.exists())
+
+
+class AllowListTests(TestCase):
+
+    def test_modules_and_views(self):
+        from . import views, always_allow_views
+        allow_list = AllowList(views=['tests.views.always_allow'],
+                               modules=['tests.always_allow_views'])
+        self.assertTrue(allow_list.allows_callable(views.always_allow))
+        self.assertTrue(allow_list.allows_callable(always_allow_views.allowed))
+        self.assertFalse(allow_list.allows_callable(views.invited_only))
+
+    def test_module_patterns_are_memoized(self):
+        from . import views
+        allow_list = AllowList(modules=['tests.*'])
+        self.assertTrue(allow_list.allows_callable(views.invited_only))
+        self.assertEqual(allow_list._memo, {views.invited_only: True})
+
+    def test_flatpages(self):
+        allow_list = AllowList(flatpages=['/about/'])
+        self.assertTrue(allow_list.allows_flatpage('/about/'))
+        self.assertTrue(allow_list.allows_flatpage('/about'))
+        self.assertFalse(AllowList(flatpages=['/about/'], append_slash=False)
+                         .allows_flatpage('/about'))